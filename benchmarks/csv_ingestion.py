@@ -0,0 +1,93 @@
+# Benchmark for the CSV ingestion of get_data: python engine with all columns vs. the configured
+# columns (translation) and dtypes of a cols section with the C and pyarrow engines
+# Run from the project root: python -m benchmarks.csv_ingestion --file files/covid/RKI_COVID19_DAILY.csv
+# Without --file a synthetic file with the columns of the RKI daily CSV is generated
+
+import argparse
+import os
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from config.core import config
+from utils.get_data import _handle_german_umlauts_in_columns, _parse_csv
+
+
+def _python_engine(file: Path) -> pd.DataFrame:
+    # previous implementation
+    df = pd.read_csv(file, engine='python', sep=',', encoding='utf-8')
+    return _handle_german_umlauts_in_columns(df=df)
+
+
+def _configured(file: Path, engine: str, schema: str) -> pd.DataFrame:
+    config.data.csv_engine = engine
+    return _parse_csv(file, 'utf-8', schema=schema)
+
+
+def _timed(func, *args) -> tuple:
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def _write_rki_daily(path: Path, rows: int):
+    rng = np.random.default_rng(42)
+    days = pd.date_range('2020-01-01', periods=900).strftime('%Y/%m/%d')
+    pd.DataFrame({
+        'FID': np.arange(rows),
+        'IdBundesland': rng.integers(1, 17, rows),
+        'Bundesland': rng.choice(['Baden-Württemberg', 'Bayern', 'Thüringen', 'Nordrhein-Westfalen'], rows),
+        'Landkreis': rng.choice(['SK Köln', 'LK München', 'SK Düsseldorf', 'LK Görlitz'], rows),
+        'Altersgruppe': rng.choice(['A00-A04', 'A05-A14', 'A15-A34', 'A35-A59', 'A60-A79', 'A80+'], rows),
+        'Geschlecht': rng.choice(['M', 'W', 'unbekannt'], rows),
+        'AnzahlFall': rng.integers(1, 20, rows),
+        'AnzahlTodesfall': rng.integers(0, 2, rows),
+        'Meldedatum': rng.choice(days, rows),
+        'IdLandkreis': rng.integers(1001, 16077, rows),
+        'Datenstand': '01.06.2022, 00:00 Uhr',
+        'NeuerFall': rng.integers(-1, 2, rows),
+        'NeuerTodesfall': rng.integers(-9, 2, rows),
+        'Refdatum': rng.choice(days, rows),
+        'NeuGenesen': rng.integers(-9, 2, rows),
+        'AnzahlGenesen': rng.integers(0, 20, rows),
+        'IstErkrankungsbeginn': rng.integers(0, 2, rows),
+        'Altersgruppe2': 'Nicht übermittelt',
+    }).to_csv(path, sep=',', index=False, encoding='utf-8')
+
+
+def run(file: Path, rows: int, schema: str):
+    tmp_file = None
+    if file is None:
+        fd, tmp_file = tempfile.mkstemp(suffix='.csv')
+        os.close(fd)
+        file = Path(tmp_file)
+        _write_rki_daily(file, rows)
+
+    try:
+        old, old_seconds = _timed(_python_engine, file)
+        print(f"file:        {file} ({os.path.getsize(file) / 2 ** 20:.0f} MB, {len(old)} rows)")
+        print(f"python:      {old_seconds:.2f}s, {old.memory_usage(deep=True).sum() / 2 ** 20:.0f} MB")
+
+        for engine in ('c', 'pyarrow'):
+            new, new_seconds = _timed(_configured, file, engine, schema)
+            # the configured path reads a subset of the columns with narrower types, values must match
+            cols = list(new.columns)
+            if not old[cols].astype(str).equals(new[cols].astype(str)):
+                raise RuntimeError(f'{engine} engine differs from python engine')
+            print(f"{engine + ':':<12} {new_seconds:.2f}s, {new.memory_usage(deep=True).sum() / 2 ** 20:.0f} MB, "
+                  f"speedup {old_seconds / new_seconds:.1f}x")
+    finally:
+        if tmp_file is not None:
+            os.remove(tmp_file)
+
+
+if __name__ == '__main__':
+    args = argparse.ArgumentParser()
+    args.add_argument('--file', type=Path, default=None, help='Local copy of the RKI daily CSV')
+    args.add_argument('--rows', type=int, default=2000000, help='Rows of the synthetic file')
+    args.add_argument('--schema', type=str, default='rki_covid_daily', help='Config cols section')
+    parsed_args = args.parse_args()
+    run(file=parsed_args.file, rows=parsed_args.rows, schema=parsed_args.schema)
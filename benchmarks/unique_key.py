@@ -0,0 +1,49 @@
+# Micro-benchmark for the unique_key construction in DB.add_meta_columns
+# Run from the project root: python -m benchmarks.unique_key --rows 1000000
+
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from utils.db_helper import build_unique_key
+
+
+def _row_wise(df: pd.DataFrame, foreign_keys: list) -> pd.Series:
+    # previous implementation
+    return df[foreign_keys].apply(lambda row: '-'.join(row.values.astype(str)), axis=1)
+
+
+def _timed(func, *args) -> tuple:
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def run(rows: int):
+    rng = np.random.default_rng(42)
+    df = pd.DataFrame({
+        'countries_fk': rng.integers(1, 250, rows),
+        'calendar_days_fk': rng.integers(1, 30000, rows),
+        'country_subdivs_3_fk': rng.integers(1, 1500, rows),
+        'agegroups_rki_fk': rng.integers(1, 8, rows),
+    })
+    foreign_keys = list(df.columns)
+
+    old, old_seconds = _timed(_row_wise, df, foreign_keys)
+    new, new_seconds = _timed(build_unique_key, df, foreign_keys)
+
+    if not old.equals(new):
+        raise RuntimeError('Vectorized unique_key differs from row-wise unique_key')
+
+    print(f"rows:       {rows}")
+    print(f"row-wise:   {old_seconds:.2f}s")
+    print(f"vectorized: {new_seconds:.2f}s")
+    print(f"speedup:    {old_seconds / new_seconds:.1f}x")
+
+
+if __name__ == '__main__':
+    args = argparse.ArgumentParser()
+    args.add_argument('--rows', type=int, default=1000000)
+    run(rows=args.parse_args().rows)
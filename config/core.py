@@ -1,3 +1,4 @@
+import os
 import sys
 from pathlib import Path
 
@@ -9,6 +10,9 @@ CONFIG_PATH = CWD / "config"
 FILES_PATH = CWD / "files"
 CONFIG_FILE = "config.yaml"
 CONFIG_FILE_DB = "config_db.yaml"
+# config_db.yaml holds credentials and is not part of the repository,
+# CONFIG_DB_PATH points to another directory, e.g. tests for the test database
+CONFIG_DB_PATH = Path(os.environ.get("CONFIG_DB_PATH", CONFIG_PATH))
 
 
 class DataConfig(BaseModel):
@@ -16,6 +20,19 @@ class DataConfig(BaseModel):
     estat_tables: dict
     genesis_tables: dict
     incidence_reference_year: str
+    incidence_reference_years: list = []
+    fetch_workers: int = 4
+    fetch_timeout: float = 900
+    fetch_timeouts: dict = {}
+    http_cache: bool = True
+    download_chunk_size: int = 1048576
+    encoding_sample_size: int = 65536
+    csv_engine: str = 'c'
+    http_retries: int = 3
+    http_backoff: float = 1.0
+    http_connect_timeout: float = 10
+    http_read_timeout: float = 120
+    download_resume_retries: int = 5
 
 
 class ColConfig(BaseModel):
@@ -43,6 +60,25 @@ class DBConfig(BaseModel):
     cols: dict
     genesis_login: dict
     agegroup_intervals: dict
+    upsert_chunk_size: int = 1000
+    write_strategies: dict = {}
+    bulk_load_threshold: int = 100000
+    pool_size: int = 5
+    pool_recycle: int = 3600
+    dimension_cache_on_disk: bool = False
+    key_modes: dict = {}
+    key_bits: dict = {}
+    change_detection: list = []
+    parquet_sink: bool = False
+    parquet_partitions: dict = {}
+    background_writer: bool = False
+    writer_queue_size: int = 4
+    parallel_workers: int = 1
+    deadlock_retries: int = 3
+    deadlock_backoff: float = 0.5
+    read_chunk_size: int = 50000
+    outbox_mode: str = 'off'
+    slow_statement_seconds: float = 5.0
 
 
 class MasterConfig(BaseModel):
@@ -83,15 +119,15 @@ def create_and_validate_config(file_name: str = None) -> MasterConfig:
 
 
 # Handle DB config seperately because of sensitive information
-def create_and_validate_config_db(file_name: str = None) -> DBConfig:
+def create_and_validate_config_db(file_name: str = None, file_path: Path = None) -> DBConfig:
     if file_name is None:
         raise Exception("File name must be specified")
 
-    config_file = read_config_file(file_name=file_name)
+    config_file = read_config_file(file_name=file_name, file_path=file_path)
 
     _config = DBConfig(**config_file.data)
     return _config
 
 
 config = create_and_validate_config(file_name=CONFIG_FILE)
-config_db = create_and_validate_config_db(file_name=CONFIG_FILE_DB)
+config_db = create_and_validate_config_db(file_name=CONFIG_FILE_DB, file_path=CONFIG_DB_PATH)
@@ -1,9 +1,12 @@
 import argparse
 import datetime as dt
 from config import core
-from config.core import config
+from config.core import config, config_db
+from utils import db_helper as database
+from utils import calculation_helper, outbox, sql_stats
 from utils.get_data import rki, estat, divi, genesis, owid
 from utils.csv_bulk import rki_bulk, divi_bulk
+from utils.fetch_helper import ConcurrentFetch
 from src import (
     covid, covid_rvalue, covid_tests, covid_vaccinations, 
     intensive_care_units, mortalities, population, hospital)
@@ -22,202 +25,294 @@ MORTALITIES_PATH = core.FILES_PATH / 'mortalities'
 HOSPITALS_PATH = core.FILES_PATH / 'hospitals'
 
 
-def daily():
-    df_rki_covid_daily = rki(
-        url=config.data.urls['rki_covid_daily'],
-        purpose='RKI_COVID19_DAILY',
-        save_file=True,
-        path=COVID_FILES_PATH,
-        data_type='ftr'
-    )
-    df_rki_rvalue_daily = rki(
-        url=config.data.urls['rki_rvalue_daily'],
-        purpose='RKI_RVALUE_DAILY',
-        save_file=True,
-        path=COVID_RVALUE_FILES_PATH,
-        data_type='ftr'
-    )
-    """
-    df_rki_vacc_daily_cumulative = rki(
-        url=config.data.urls['rki_vaccinations_daily_cumulative'],
-        purpose='RKI_VACC_DAILY_CUMULATIVE',
-        save_file=True,
-        path=COVID_VACC_FILES_PATH,
-        data_type='ftr'
-    )
-    """
-    df_owid_vacc_daily = owid(
-        url=config.data.urls['owid_vaccinations_daily'],
-        purpose="OWID_VACC_DAILY",
-        save_file=True,
-        path=core.FILES_PATH / 'covid_vaccinations',
-        data_type="ftr"
-    )
-    df_owid_vacc_daily_manufacturer = owid(
-        url=config.data.urls['owid_vaccinations_daily_manufacturer'],
-        purpose="OWID_VACC_DAILY_MANUFACTURER",
-        save_file=True,
-        path=core.FILES_PATH / 'covid_vaccinations',
-        data_type="ftr"
-    )
-    df_rki_vacc_daily_states = rki(
-        url=config.data.urls['rki_vaccination_states'],
-        purpose='RKI_VACC_DAILY_STATES',
-        save_file=True,
-        path=COVID_VACC_FILES_PATH,
-        data_type='ftr'
-    )
-    df_divi_itcu_daily_counties = divi(
-        url=config.data.urls['divi_itcu_daily_counties'],
-        purpose='DIVI_ITCU_DAILY_COUNTIES',
-        save_file=True,
-        path=ITCU_FILES_PATH,
-        data_type='ftr'
-    )
-    
-    df_divi_itcu_daily_states = divi(
-        url=config.data.urls['divi_itcu_daily_states'],
-        purpose='DIVI_ITCU_DAILY_STATES',
-        save_file=True,
-        path=ITCU_FILES_PATH,
-        data_type='ftr'
-    ) 
-    covid.rki_daily(df=df_rki_covid_daily)
-    covid.rki_daily_states(df=df_rki_covid_daily)
-    covid.rki_daily_counties(df=df_rki_covid_daily)
-    covid.rki_daily_agegroups(df=df_rki_covid_daily)
-    covid.rki_weekly_cumulative(df=df_rki_covid_daily)
+def _rki_covid_daily(df):
+    covid.rki_daily(df=df)
+    covid.rki_daily_states(df=df)
+    covid.rki_daily_counties(df=df)
+    covid.rki_daily_agegroups(df=df)
+    covid.rki_weekly_cumulative(df=df)
     covid.rki_annual()
-    covid_rvalue.rki_daily(df=df_rki_rvalue_daily)
-    covid_vaccinations.owid_vaccinations_daily(df=df_owid_vacc_daily)
-    covid_vaccinations.owid_vaccinations_daily_manufacturer(df=df_owid_vacc_daily_manufacturer)
-    #covid_vaccinations.rki_vaccinations_daily_cumulative(df=df_rki_vacc_daily_cumulative)
-    covid_vaccinations.rki_vaccinations_daily_states(df=df_rki_vacc_daily_states)
-    intensive_care_units.divi_daily_counties(df=df_divi_itcu_daily_counties)
-    intensive_care_units.divi_daily_states(df=df_divi_itcu_daily_states)
+
+
+def daily():
+    # all sources are downloaded concurrently, each transformation starts as soon as its own input arrived,
+    # i.e. the small sources are transformed while the large RKI_COVID19_DAILY is still downloading
+    transformations = {
+        'RKI_COVID19_DAILY': _rki_covid_daily,
+        'RKI_RVALUE_DAILY': covid_rvalue.rki_daily,
+        'OWID_VACC_DAILY': covid_vaccinations.owid_vaccinations_daily,
+        'OWID_VACC_DAILY_MANUFACTURER': covid_vaccinations.owid_vaccinations_daily_manufacturer,
+        # 'RKI_VACC_DAILY_CUMULATIVE': covid_vaccinations.rki_vaccinations_daily_cumulative,
+        'RKI_VACC_DAILY_STATES': covid_vaccinations.rki_vaccinations_daily_states,
+        'DIVI_ITCU_DAILY_COUNTIES': intensive_care_units.divi_daily_counties,
+        'DIVI_ITCU_DAILY_STATES': intensive_care_units.divi_daily_states,
+    }
+    with ConcurrentFetch({
+        'RKI_COVID19_DAILY': (rki, dict(
+            url=config.data.urls['rki_covid_daily'],
+            purpose='RKI_COVID19_DAILY',
+            save_file=True,
+            path=COVID_FILES_PATH,
+            data_type='ftr',
+            schema='rki_covid_daily',
+            resumable=True
+        )),
+        'RKI_RVALUE_DAILY': (rki, dict(
+            url=config.data.urls['rki_rvalue_daily'],
+            purpose='RKI_RVALUE_DAILY',
+            save_file=True,
+            path=COVID_RVALUE_FILES_PATH,
+            data_type='ftr',
+            schema='rki_rvalue_daily'
+        )),
+        # 'RKI_VACC_DAILY_CUMULATIVE': (rki, dict(
+        #     url=config.data.urls['rki_vaccinations_daily_cumulative'],
+        #     purpose='RKI_VACC_DAILY_CUMULATIVE',
+        #     save_file=True,
+        #     path=COVID_VACC_FILES_PATH,
+        #     data_type='ftr'
+        # )),
+        'OWID_VACC_DAILY': (owid, dict(
+            url=config.data.urls['owid_vaccinations_daily'],
+            purpose="OWID_VACC_DAILY",
+            save_file=True,
+            path=core.FILES_PATH / 'covid_vaccinations',
+            data_type="ftr",
+            schema='owid_vaccinations_daily'
+        )),
+        'OWID_VACC_DAILY_MANUFACTURER': (owid, dict(
+            url=config.data.urls['owid_vaccinations_daily_manufacturer'],
+            purpose="OWID_VACC_DAILY_MANUFACTURER",
+            save_file=True,
+            path=core.FILES_PATH / 'covid_vaccinations',
+            data_type="ftr",
+            schema='owid_vaccinations_daily_manufacturer'
+        )),
+        'RKI_VACC_DAILY_STATES': (rki, dict(
+            url=config.data.urls['rki_vaccination_states'],
+            purpose='RKI_VACC_DAILY_STATES',
+            save_file=True,
+            path=COVID_VACC_FILES_PATH,
+            data_type='ftr',
+            schema='rki_vaccinations_daily_states'
+        )),
+        'DIVI_ITCU_DAILY_COUNTIES': (divi, dict(
+            url=config.data.urls['divi_itcu_daily_counties'],
+            purpose='DIVI_ITCU_DAILY_COUNTIES',
+            save_file=True,
+            path=ITCU_FILES_PATH,
+            data_type='ftr',
+            schema='divi_itcu_daily_counties'
+        )),
+        'DIVI_ITCU_DAILY_STATES': (divi, dict(
+            url=config.data.urls['divi_itcu_daily_states'],
+            purpose='DIVI_ITCU_DAILY_STATES',
+            save_file=True,
+            path=ITCU_FILES_PATH,
+            data_type='ftr',
+            schema='divi_itcu_daily_states'
+        )),
+    }) as sources:
+        for name, df in sources.completed():
+            transformations[name](df=df)
+
 
 def weekly():
-    df_rki_tests_weekly = rki(
-        url=config.data.urls['rki_tests_weekly'],
-        purpose='RKI_TESTS_WEEKLY',
-        save_file=True,
-        path=COVID_TEST_FILES_PATH,
-        is_excel=True,
-        sheet_name='1_Testzahlerfassung',
-        data_type='xlsx'
-    )
-    df_estat_deaths_weekly_agegroups = estat(
-        code=config.data.estat_tables['estsat_weekly_deaths_agegroups'],
-        purpose='ESTAT_DEATHS_WEEKLY_AGEGROUPS',
-        save_file=True,
-        path=MORTALITIES_PATH,
-        data_type='ftr'
-    )
-
-    covid_tests.rki_weekly(df=df_rki_tests_weekly)
-    mortalities.estat_deaths_weekly_agegroups(df=df_estat_deaths_weekly_agegroups)
+    with ConcurrentFetch({
+        'RKI_TESTS_WEEKLY': (rki, dict(
+            url=config.data.urls['rki_tests_weekly'],
+            purpose='RKI_TESTS_WEEKLY',
+            save_file=True,
+            path=COVID_TEST_FILES_PATH,
+            is_excel=True,
+            sheet_name='1_Testzahlerfassung',
+            data_type='xlsx'
+        )),
+        'ESTAT_DEATHS_WEEKLY_AGEGROUPS': (estat, dict(
+            code=config.data.estat_tables['estsat_weekly_deaths_agegroups'],
+            purpose='ESTAT_DEATHS_WEEKLY_AGEGROUPS',
+            save_file=True,
+            path=MORTALITIES_PATH,
+            data_type='ftr'
+        )),
+    }) as sources:
+        covid_tests.rki_weekly(df=sources.get('RKI_TESTS_WEEKLY'))
+        mortalities.estat_deaths_weekly_agegroups(df=sources.get('ESTAT_DEATHS_WEEKLY_AGEGROUPS'))
 
 
 def annual():
-    df_estat_death_causes_annual_agegroups = estat(
-        code=config.data.estat_tables['estsat_death_causes_annual_agegroups'],
-        purpose='ESTAT_DEATH_CAUSES_ANNUAL_AGEGROUPS',
-        save_file=False,
-        data_type='ftr'
-    )
-    df_estat_population_countries = estat(
-        code=config.data.estat_tables['estat_population_nuts_2'],
-        purpose="POP_COUNTRIES",
-        save_file=False,
-        data_type='ftr'
-    )
-    df_estat_population_subdiv1 = estat(
-        code=config.data.estat_tables['estat_population_nuts_2'],
-        purpose="POP_SUBDIV1",
-        save_file=False,
-        data_type='ftr'
-    )
-    df_estat_population_subdiv2 = estat(
-        code=config.data.estat_tables['estat_population_nuts_2'],
-        purpose="POP_SUBDIV2",
-        save_file=False,
-        data_type='ftr'
-    )
-    df_estat_population_agegroups = estat(
-        code=config.data.estat_tables['estat_population_agegroups'],
-        purpose="POP_AGEGROUPS",
-        save_file=False,
-        data_type='ftr'
-    )
-    df_estat_life_exp = estat(
-        code=config.data.estat_tables['estat_life_expectancy'],
-        purpose="LIFE_EXP",
-        save_file=False,
-        data_type='ftr'
-    )
-    df_estat_median_age = estat(
-        code=config.data.estat_tables['estat_population_structure_indicators'],
-        purpose="POP_STRUCT_IND",
-        save_file=False,
-        data_type='ftr'
-    )
-    df_genesis_hospitals_annual = genesis(
-        code=config.data.genesis_tables['hospitals_annual'],
-        purpose='HOSP_ANNUAL',
-        save_file=True,
-        path=HOSPITALS_PATH,
-        data_type='csv'
-    )
-    df_genesis_hospital_staff_annual = genesis(
-        code=config.data.genesis_tables['hospital_staff_annual'],
-        purpose='HOSP_STAFF_ANNUAL',
-        save_file=True,
-        path=HOSPITALS_PATH,
-        data_type='csv'
-    )
-    df_genesis_population_subdiv3 = genesis(
-        code=config.data.genesis_tables['population_subdivision_3'],
-        purpose='POP_SUBDIV3',
-        save_file=False,
-        data_type='csv'
-    )
-    mortalities.estat_death_causes_annual_agegroups(df=df_estat_death_causes_annual_agegroups)
-    population.estat_population_countries(df=df_estat_population_countries)
-    population.estat_population_subdivision_1(df=df_estat_population_subdiv1)
-    population.estat_population_subdivision_2(df=df_estat_population_subdiv2)
-    population.estat_population_agegroups(df=df_estat_population_agegroups)
-    population.estat_life_exp_at_birth(df=df_estat_life_exp)
-    population.estat_median_age(df=df_estat_median_age)
-    hospital.genesis_hospitals_annual(df=df_genesis_hospitals_annual)
-    hospital.genesis_hospital_staff_annual(df=df_genesis_hospital_staff_annual)
-    population.genesis_population_subdivision_3(df=df_genesis_population_subdiv3)
+    with ConcurrentFetch({
+        'ESTAT_DEATH_CAUSES_ANNUAL_AGEGROUPS': (estat, dict(
+            code=config.data.estat_tables['estsat_death_causes_annual_agegroups'],
+            purpose='ESTAT_DEATH_CAUSES_ANNUAL_AGEGROUPS',
+            save_file=False,
+            data_type='ftr'
+        )),
+        # one download for the population of countries and both subdivision levels
+        'POP_NUTS_2': (estat, dict(
+            code=config.data.estat_tables['estat_population_nuts_2'],
+            purpose="POP_NUTS_2",
+            save_file=False,
+            data_type='ftr'
+        )),
+        'POP_AGEGROUPS': (estat, dict(
+            code=config.data.estat_tables['estat_population_agegroups'],
+            purpose="POP_AGEGROUPS",
+            save_file=False,
+            data_type='ftr'
+        )),
+        'LIFE_EXP': (estat, dict(
+            code=config.data.estat_tables['estat_life_expectancy'],
+            purpose="LIFE_EXP",
+            save_file=False,
+            data_type='ftr'
+        )),
+        'POP_STRUCT_IND': (estat, dict(
+            code=config.data.estat_tables['estat_population_structure_indicators'],
+            purpose="POP_STRUCT_IND",
+            save_file=False,
+            data_type='ftr'
+        )),
+        'HOSP_ANNUAL': (genesis, dict(
+            code=config.data.genesis_tables['hospitals_annual'],
+            purpose='HOSP_ANNUAL',
+            save_file=True,
+            path=HOSPITALS_PATH,
+            data_type='csv'
+        )),
+        'HOSP_STAFF_ANNUAL': (genesis, dict(
+            code=config.data.genesis_tables['hospital_staff_annual'],
+            purpose='HOSP_STAFF_ANNUAL',
+            save_file=True,
+            path=HOSPITALS_PATH,
+            data_type='csv'
+        )),
+        'POP_SUBDIV3': (genesis, dict(
+            code=config.data.genesis_tables['population_subdivision_3'],
+            purpose='POP_SUBDIV3',
+            save_file=False,
+            data_type='csv'
+        )),
+    }) as sources:
+        mortalities.estat_death_causes_annual_agegroups(df=sources.get('ESTAT_DEATH_CAUSES_ANNUAL_AGEGROUPS'))
+        df_estat_population_nuts_2 = sources.get('POP_NUTS_2')
+        population.estat_population_countries(df=df_estat_population_nuts_2)
+        population.estat_population_subdivision_1(df=df_estat_population_nuts_2)
+        population.estat_population_subdivision_2(df=df_estat_population_nuts_2)
+        population.estat_population_agegroups(df=sources.get('POP_AGEGROUPS'))
+        population.estat_life_exp_at_birth(df=sources.get('LIFE_EXP'))
+        population.estat_median_age(df=sources.get('POP_STRUCT_IND'))
+        hospital.genesis_hospitals_annual(df=sources.get('HOSP_ANNUAL'))
+        hospital.genesis_hospital_staff_annual(df=sources.get('HOSP_STAFF_ANNUAL'))
+        population.genesis_population_subdivision_3(df=sources.get('POP_SUBDIV3'))
+
+
+def migrate_unique_keys():
+    # convert every table configured with key_mode 'bigint' (key_modes in config_db.yaml)
+    db = database.DB()
+    for table, key_mode in config_db.key_modes.items():
+        if key_mode == 'bigint':
+            print("migrating " + table + "...")
+            db.migrate_unique_key(table)
+    db.db_close()
+
+
+def outbox_replay():
+    # write all batches spooled to files/outbox (outbox_mode in config_db.yaml)
+    db = database.DB()
+    outbox.replay(db)
+    db.db_close()
+
+
+def add_incidence_columns():
+    # add the incidence_7d*_<year> columns of incidence_reference_years (config.yaml) to the covid tables
+    db = database.DB()
+    columns = calculation_helper.get_incidence_columns(covid.INCIDENCE_REF_YEARS)
+    for table in covid.INCIDENCE_TABLES:
+        if 'incidence_7d_ref_sympt' in db.get_schema(table)['columns']:
+            print("adding incidence columns to " + table + "...")
+            db.add_columns(table, columns, 'FLOAT NULL', after='incidence_7d_ref_sympt')
+    db.db_close()
+
+
+def create_sqlite_schema():
+    # create the tables and calendar dimensions of an empty SQLite database (dialect 'sqlite:///' in config_db.yaml)
+    db = database.DB()
+    db.create_sqlite_schema()
+    db.db_close()
+
+
+def add_row_hashes():
+    # add the row_hash column to every table with change detection (change_detection in config_db.yaml)
+    db = database.DB()
+    for table in config_db.change_detection:
+        print("adding row_hash to " + table + "...")
+        db.add_row_hash_column(table)
+    db.db_close()
 
 
 if __name__ == '__main__':
     args = argparse.ArgumentParser()
     args.add_argument('--procedure', default='daily')
-    procedure = args.parse_args()._get_kwargs()[0][1]
-
-    if procedure == 'daily':
-        print("executing daily procedure...")
-        daily()
-    elif procedure == 'weekly':
-        print("executing weekly procedure...")
-        weekly()
-    elif procedure == 'annual':
-        print("executing annual procedure...")
-        annual()
-    elif procedure == 'rki_bulk_csv':
-        print("executing rki bulk (csv) procedure...")
-        rki_bulk(filetype='csv')
-    elif procedure == 'rki_bulk_ftr':
-        print("executing rki bulk (feather) procedure...")
-        rki_bulk(filetype='ftr')
-    elif procedure == 'divi_bulk_csv':
-        print("executing divi bulk (csv) procedure...")
-        divi_bulk(filetype='csv')
-    elif procedure == 'divi_bulk_ftr':
-        print("executing divi bulk (feather) procedure...")
-        divi_bulk(filetype='ftr')
-    else:
-        Exception("Invalid argument! Expected 'daily', 'weekly', 'annual', 'rki_bulk_csv', 'divi_bulk_csv', 'rki_bulk_ftr' or 'divi_bulk_ftr'")
+    args.add_argument('--workers', type=int, default=None,
+                      help="connections used to write large frames in parallel (parallel_workers in config_db.yaml)")
+    parsed_args = args.parse_args()
+    procedure = parsed_args.procedure
+
+    if parsed_args.workers is not None:
+        config_db.parallel_workers = parsed_args.workers
+
+    try:
+        if config_db.background_writer and procedure in ('daily', 'weekly', 'annual'):
+            # transformations continue while the previous frame is written (writer_queue_size in config_db.yaml)
+            database.start_writer()
+
+        if procedure == 'daily':
+            print("executing daily procedure...")
+            daily()
+        elif procedure == 'weekly':
+            print("executing weekly procedure...")
+            weekly()
+        elif procedure == 'annual':
+            print("executing annual procedure...")
+            annual()
+        elif procedure == 'rki_bulk_csv':
+            print("executing rki bulk (csv) procedure...")
+            rki_bulk(filetype='csv')
+        elif procedure == 'rki_bulk_ftr':
+            print("executing rki bulk (feather) procedure...")
+            rki_bulk(filetype='ftr')
+        elif procedure == 'divi_bulk_csv':
+            print("executing divi bulk (csv) procedure...")
+            divi_bulk(filetype='csv')
+        elif procedure == 'divi_bulk_ftr':
+            print("executing divi bulk (feather) procedure...")
+            divi_bulk(filetype='ftr')
+        elif procedure == 'invalidate_dimensions':
+            print("invalidating dimension cache...")
+            database.invalidate_dimensions()
+        elif procedure == 'migrate_unique_keys':
+            print("migrating unique keys...")
+            migrate_unique_keys()
+        elif procedure == 'add_row_hashes':
+            print("adding row hashes...")
+            add_row_hashes()
+        elif procedure == 'add_incidence_columns':
+            print("adding incidence columns...")
+            add_incidence_columns()
+        elif procedure == 'create_sqlite_schema':
+            print("creating sqlite schema...")
+            create_sqlite_schema()
+        elif procedure == 'outbox_replay':
+            print("replaying outbox...")
+            outbox_replay()
+        else:
+            Exception("Invalid argument! Expected 'daily', 'weekly', 'annual', 'rki_bulk_csv', 'divi_bulk_csv', 'rki_bulk_ftr', 'divi_bulk_ftr', 'invalidate_dimensions', 'migrate_unique_keys', 'add_row_hashes', 'add_incidence_columns', 'create_sqlite_schema' or 'outbox_replay'")
+    finally:
+        # wait for queued writes (re-raises writer errors), then release the pooled connections
+        try:
+            database.stop_writer()
+        finally:
+            database.dispose_engine()
+            # time spent in the database per table (slow statements: files/logs)
+            sql_stats.print_summary()
@@ -3,13 +3,16 @@ import datetime as dt
 import pandas as pd
 
 from config.core import config, config_db
-from utils import calculation_helper
+from utils import calculation_helper, rollup_helper
 from utils import db_helper as database
 
 # Constants
 TODAY = dt.datetime.today()
 TODAY = dt.datetime(TODAY.year, TODAY.month, TODAY.day)
 INCIDENCE_REF_YEAR = config.data.incidence_reference_year
+INCIDENCE_REF_YEARS = [INCIDENCE_REF_YEAR] + [
+    year for year in config.data.incidence_reference_years if year != INCIDENCE_REF_YEAR
+]
 RKI_DAILY_TRANSLATION = config.cols.rki_covid_daily["translation"]
 RKI_DAILY_TABLE = config_db.tables["covid_daily"]
 RKI_DAILY_STATES_TABLE = config_db.tables["covid_daily_states"]
@@ -17,6 +20,9 @@ RKI_DAILY_COUNTIES_TABLE = config_db.tables["covid_daily_counties"]
 RKI_DAILY_AGEGROUPS_TABLE = config_db.tables["covid_daily_agegroups"]
 RKI_WEEKLY_CUMULATIVE_TABLE = config_db.tables["covid_weekly_cumulative"]
 RKI_ANNUAL_TABLE = config_db.tables["covid_annual"]
+RKI_MONTHLY_TABLE = config_db.tables.get("covid_monthly")  # optional
+# tables with incidence_7d* columns, they get incidence_7d*_<year> columns for incidence_reference_years
+INCIDENCE_TABLES = [RKI_DAILY_TABLE, RKI_DAILY_STATES_TABLE, RKI_DAILY_COUNTIES_TABLE, RKI_DAILY_AGEGROUPS_TABLE]
 SUBDIVISION_2_ID = config.cols.rki_covid_daily["cols"]["subdivision_2_id"]
 REPORTING_DATE = config.cols.rki_covid_daily["cols"]["reporting_date"]
 BUNDESLAND_ID = config.cols.rki_covid_daily["cols"]["bundesland_id"]
@@ -56,7 +62,7 @@ def rki_daily(df: pd.DataFrame, date: dt.datetime = TODAY) -> None:
     tmp = tmp.groupby(REPORTING_DATE).sum().reset_index()
     tmp[GEO] = GERMANY
     tmp = calculation_helper.rki_calc_7d_incidence(
-        df=tmp, level=0, reference_year=INCIDENCE_REF_YEAR
+        df=tmp, level=0, reference_year=INCIDENCE_REF_YEARS, db=db
     )
 
     tmp = db.merge_calendar_days_fk(df=tmp, left_on=REPORTING_DATE)
@@ -75,7 +81,7 @@ def rki_daily_states(df: pd.DataFrame, date: dt.datetime = TODAY) -> None:
     ]  # ignore rows with IdBundesland -1 (nicht erhoben)
     tmp = tmp.groupby([BUNDESLAND_ID, REPORTING_DATE]).sum().reset_index()
     tmp = calculation_helper.rki_calc_7d_incidence(
-        df=tmp, level=1, reference_year=INCIDENCE_REF_YEAR
+        df=tmp, level=1, reference_year=INCIDENCE_REF_YEARS, db=db
     )
 
     tmp = db.merge_calendar_days_fk(df=tmp, left_on=REPORTING_DATE)
@@ -97,7 +103,7 @@ def rki_daily_counties(df: pd.DataFrame, date: dt.datetime = TODAY) -> None:
     )  # combine berlin district
     tmp = tmp.groupby([SUBDIVISION_2_ID, REPORTING_DATE]).sum().reset_index()
     tmp = calculation_helper.rki_calc_7d_incidence(
-        df=tmp, level=3, reference_year="2021"
+        df=tmp, level=3, reference_year=INCIDENCE_REF_YEARS, db=db
     )
 
     tmp = db.merge_calendar_days_fk(df=tmp, left_on=REPORTING_DATE)
@@ -116,7 +122,7 @@ def rki_daily_agegroups(df: pd.DataFrame, date: dt.datetime = TODAY) -> None:
     tmp.replace({RKI_AGEGROUPS: RKI_AGEGROUP_MAP}, inplace=True)
     tmp[GEO] = GERMANY
     tmp = calculation_helper.rki_calc_7d_incidence(
-        df=tmp, level=0, reference_year=INCIDENCE_REF_YEAR
+        df=tmp, level=0, reference_year=INCIDENCE_REF_YEARS, db=db
     )
 
     tmp = db.merge_calendar_days_fk(df=tmp, left_on=REPORTING_DATE)
@@ -142,38 +148,25 @@ def rki_weekly_cumulative(df: pd.DataFrame) -> None:
     db.db_close()
 
 
-def rki_annual() -> None:
+def rki_annual(full: bool = False) -> None:
+    # annual (and optionally monthly) deltas of the cumulative daily numbers,
+    # only periods touched since the last run are recomputed
     db = database.DB()
-    df = db.get_table("covid_daily")
-    df_calendar_days = db.get_table("_calendar_days")
-    tmp = df.merge(
-        df_calendar_days,
-        left_on="calendar_days_fk",
-        right_on="calendar_days_id",
-        how="left",
-    )
-    tmp = _convert_date(df=tmp, dates=["iso_day"])
-
-    df_2020 = tmp[tmp["iso_day"] == dt.datetime(2020, 12, 31)]
-    df_2021 = tmp[tmp["iso_day"] == dt.datetime(2021, 12, 31)]
-    df_2022 = tmp[
-        tmp["iso_day"]
-        == dt.datetime(dt.date.today().year, dt.date.today().month, dt.date.today().day)
-    ]
-
-    tmp = pd.concat([df_2020, df_2021, df_2022])
-    tmp.set_index(tmp["iso_day"].dt.year, inplace=True)
-    tmp = tmp._get_numeric_data()
-    tmp.loc[2021] = tmp.loc[2021] - tmp.loc[2020]
-    tmp.loc[2022] = tmp.loc[2022] - (tmp.loc[2021] + tmp.loc[2020])
-    tmp.reset_index(inplace=True)
-    tmp.rename(columns={"iso_day": "iso_year"}, inplace=True)
-    tmp.drop("countries_fk", axis=1, inplace=True)
-    tmp[GEO] = GERMANY
-
-    tmp = db.merge_calendar_years_fk(df=tmp, left_on="iso_year")
-    tmp = db.merge_countries_fk(df=tmp, left_on=GEO, country_code=NUTS_0)
-    db.insert_into(
-        df=tmp, table=RKI_ANNUAL_TABLE, replace=False, add_meta_columns=False
+    rollup_helper.rollup(
+        db=db,
+        source_table=RKI_DAILY_TABLE,
+        target_table=RKI_ANNUAL_TABLE,
+        group_cols=["countries_fk"],
+        period="year",
+        full=full,
     )
+    if RKI_MONTHLY_TABLE is not None:
+        rollup_helper.rollup(
+            db=db,
+            source_table=RKI_DAILY_TABLE,
+            target_table=RKI_MONTHLY_TABLE,
+            group_cols=["countries_fk"],
+            period="month",
+            full=full,
+        )
     db.db_close()
@@ -22,5 +22,5 @@ def rki_daily(df: pd.DataFrame) -> None:
     tmp = db.merge_calendar_days_fk(df=tmp, left_on=DATE)
     tmp[GEO] = GERMANY
     tmp = db.merge_countries_fk(df=tmp, left_on=GEO, country_code=ISO_3166_1_ALPHA2)
-    db.insert_or_update(df=tmp, table=RKI_DAILY_TABLE)
+    db.insert_only_new_rows(df=tmp, table=RKI_DAILY_TABLE)
     db.db_close()
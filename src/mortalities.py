@@ -79,7 +79,7 @@ def estat_deaths_weekly_agegroups(df: pd.DataFrame) -> None:
     tmp = db.merge_calendar_weeks_fk(tmp, left_on="iso_key")
     tmp = db.merge_countries_fk(tmp, left_on="geo", country_code="iso_3166_1_alpha2")
 
-    db.insert_or_update(df=tmp, table=ESTAT_DEATHS_WEEKLY_AGEGROUPS_TABLE)
+    db.insert_only_new_rows(df=tmp, table=ESTAT_DEATHS_WEEKLY_AGEGROUPS_TABLE)
     db.db_close()
 
 
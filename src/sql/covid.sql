@@ -1,3 +1,8 @@
+-- with incidence_reference_years in config.yaml, the tables with incidence_7d* columns also get
+-- incidence_7d_<year>, incidence_7d_sympt_<year>, incidence_7d_ref_<year> and incidence_7d_ref_sympt_<year>
+-- (float) for every reference year, see procedure add_incidence_columns in main.py, e.g. for 2020 and 2021:
+-- ALTER TABLE covid_daily ADD COLUMN incidence_7d_2020 float AFTER incidence_7d_ref_sympt;
+
 CREATE TABLE covid_daily (
 	ID int NOT NULL AUTO_INCREMENT PRIMARY KEY,
 	countries_fk int NOT NULL,
@@ -34,10 +39,36 @@ CREATE TABLE covid_daily (
         ON UPDATE CASCADE
 ) AUTO_INCREMENT = 1;
 
-CREATE TABLE covid_yearly (
-	covid_yearly_id int NOT NULL AUTO_INCREMENT PRIMARY KEY,
+-- covid_annual and covid_monthly are maintained by the incremental rollup (rki_annual), which upserts on unique_key
+-- and starts from max(last_update). covid_annual tables written by the former truncate-and-insert rki_annual
+-- have neither column and need:
+-- ALTER TABLE covid_annual ADD COLUMN last_update DATETIME, ADD COLUMN unique_key VARCHAR(255) NULL;
+-- UPDATE covid_annual SET unique_key = CONCAT(countries_fk, '-', calendar_years_fk);
+-- ALTER TABLE covid_annual MODIFY unique_key VARCHAR(255) NOT NULL, ADD UNIQUE INDEX unique_key (unique_key);
+CREATE TABLE covid_annual (
+	covid_annual_id int NOT NULL AUTO_INCREMENT PRIMARY KEY,
+	countries_fk int NOT NULL,
+    calendar_years_fk int NOT NULL,
+    cases int,
+    deaths int,
+    recovered int,
+    active_cases int,
+    last_update DATETIME,
+    unique_key VARCHAR(255) NOT NULL UNIQUE,
+    FOREIGN KEY (countries_fk) REFERENCES _countries (countries_id)
+        ON DELETE CASCADE
+        ON UPDATE CASCADE,
+    FOREIGN KEY (calendar_years_fk) REFERENCES _calendar_years (calendar_years_id)
+        ON DELETE CASCADE
+        ON UPDATE CASCADE
+) AUTO_INCREMENT = 1;
+
+-- optional (covid_monthly in config_db.yaml), calendar_months_fk is a yyyymm key without a dimension table
+CREATE TABLE covid_monthly (
+	covid_monthly_id int NOT NULL AUTO_INCREMENT PRIMARY KEY,
 	countries_fk int NOT NULL,
     calendar_years_fk int NOT NULL,
+    calendar_months_fk int NOT NULL,
     cases int,
     deaths int,
     recovered int,
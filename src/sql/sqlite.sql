@@ -0,0 +1,490 @@
+-- Schema of the embedded SQLite backend (dialect 'sqlite:///' in config_db.yaml), created by
+-- python main.py --procedure create_sqlite_schema
+-- Table names are the keys of config_db.tables, so the tables map of a SQLite config maps every key to itself.
+-- The ON CONFLICT upserts of the SQLite backend rely on the UNIQUE unique_key of every fact table.
+
+-- dimensions
+
+CREATE TABLE IF NOT EXISTS _calendar_years (
+    calendar_years_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    iso_year int NOT NULL UNIQUE
+);
+
+CREATE TABLE IF NOT EXISTS _calendar_weeks (
+    calendar_weeks_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    calendar_years_fk int NOT NULL REFERENCES _calendar_years (calendar_years_id),
+    iso_week int NOT NULL,
+    iso_key int NOT NULL UNIQUE
+);
+
+CREATE TABLE IF NOT EXISTS _calendar_days (
+    calendar_days_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    calendar_weeks_fk int NOT NULL REFERENCES _calendar_weeks (calendar_weeks_id),
+    iso_day date NOT NULL UNIQUE
+);
+
+CREATE TABLE IF NOT EXISTS _agegroups_10y (
+    agegroups_10y_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    agegroup varchar(5) NOT NULL UNIQUE
+);
+
+CREATE TABLE IF NOT EXISTS _agegroups_05y (
+    agegroups_05y_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    agegroup varchar(5) NOT NULL UNIQUE
+);
+
+CREATE TABLE IF NOT EXISTS _agegroups_rki (
+    agegroups_rki_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    agegroup varchar(5) NOT NULL UNIQUE
+);
+
+CREATE TABLE IF NOT EXISTS _classifications_icd10 (
+    classifications_icd10_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    icd10 varchar(20) NOT NULL UNIQUE,
+    description_en text,
+    description_de text
+);
+
+CREATE TABLE IF NOT EXISTS _countries (
+    countries_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    country_en varchar(100) NOT NULL,
+    country_de varchar(100) NOT NULL,
+    latitude double,
+    longitude double,
+    iso_3166_1_alpha2 varchar(2) NOT NULL UNIQUE,
+    iso_3166_1_alpha3 varchar(3) NOT NULL UNIQUE,
+    iso_3166_1_numeric int NOT NULL UNIQUE,
+    nuts_0 varchar(2) UNIQUE
+);
+
+CREATE TABLE IF NOT EXISTS _country_subdivs_1 (
+    country_subdivs_1_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    countries_fk int NOT NULL REFERENCES _countries (countries_id),
+    subdivision_1 varchar(255) NOT NULL,
+    latitude double,
+    longitude double,
+    iso_3166_2 varchar(5) UNIQUE,
+    nuts_1 varchar(3) UNIQUE,
+    bundesland_id int UNIQUE
+);
+
+CREATE TABLE IF NOT EXISTS _country_subdivs_2 (
+    country_subdivs_2_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    country_subdivs_1_fk int NOT NULL REFERENCES _country_subdivs_1 (country_subdivs_1_id),
+    subdivision_2 varchar(255) NOT NULL,
+    latitude double,
+    longitude double,
+    nuts_2 varchar(4) UNIQUE
+);
+
+CREATE TABLE IF NOT EXISTS _country_subdivs_3 (
+    country_subdivs_3_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    country_subdivs_2_fk int NOT NULL REFERENCES _country_subdivs_2 (country_subdivs_2_id),
+    subdivision_3 varchar(255) NOT NULL,
+    latitude double,
+    longitude double,
+    nuts_3 varchar(5) UNIQUE,
+    ags int UNIQUE
+);
+
+CREATE TABLE IF NOT EXISTS _vaccines (
+    vaccines_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    brand_name_1 varchar(100) NOT NULL UNIQUE,
+    brand_name_2 varchar(100) UNIQUE,
+    manufacturer varchar(100) NOT NULL,
+    vaccine_type varchar(50)
+);
+
+CREATE TABLE IF NOT EXISTS _vaccine_series (
+    vaccine_series_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    series int NOT NULL UNIQUE,
+    description varchar(100)
+);
+
+INSERT OR IGNORE INTO _agegroups_10y (agegroup) VALUES ('00-09'), ('10-19'), ('20-29'), ('30-39'), ('40-49'), ('50-59'),
+('60-69'), ('70-79'), ('80+'), ('UNK');
+
+INSERT OR IGNORE INTO _agegroups_05y (agegroup) VALUES ('00-04'), ('05-09'), ('10-14'), ('15-19'), ('20-24'), ('25-29'),
+('30-34'), ('35-39'), ('40-44'), ('45-49'), ('50-54'), ('55-59'), ('60-64'), ('65-69'), ('70-74'), ('75-79'), ('80+'), ('UNK');
+
+INSERT OR IGNORE INTO _agegroups_rki (agegroup) VALUES ('00-04'), ('05-14'), ('15-34'), ('35-59'), ('60-79'), ('80+'), ('UNK');
+
+-- covid
+
+CREATE TABLE IF NOT EXISTS covid_daily (
+    covid_daily_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    countries_fk int NOT NULL,
+    calendar_days_fk int NOT NULL,
+    calendar_weeks_fk int,
+    cases int,
+    cases_delta int,
+    cases_delta_ref int,
+    cases_delta_ref_sympt int,
+    cases_7d int,
+    cases_7d_sympt int,
+    cases_7d_ref int,
+    cases_7d_ref_sympt int,
+    deaths int,
+    deaths_delta int,
+    recovered int,
+    recovered_delta int,
+    active_cases int,
+    active_cases_delta int,
+    incidence_7d float,
+    incidence_7d_sympt float,
+    incidence_7d_ref float,
+    incidence_7d_ref_sympt float,
+    last_update DATETIME,
+    unique_key VARCHAR(255) NOT NULL UNIQUE
+);
+
+CREATE TABLE IF NOT EXISTS covid_daily_states (
+    covid_daily_states_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    country_subdivs_1_fk int NOT NULL,
+    calendar_days_fk int NOT NULL,
+    cases int,
+    cases_delta int,
+    cases_delta_ref int,
+    cases_delta_ref_sympt int,
+    cases_7d int,
+    cases_7d_sympt int,
+    cases_7d_ref int,
+    cases_7d_ref_sympt int,
+    deaths int,
+    deaths_delta int,
+    recovered int,
+    recovered_delta int,
+    active_cases int,
+    active_cases_delta int,
+    incidence_7d float,
+    incidence_7d_sympt float,
+    incidence_7d_ref float,
+    incidence_7d_ref_sympt float,
+    last_update DATETIME,
+    unique_key VARCHAR(255) NOT NULL UNIQUE
+);
+
+CREATE TABLE IF NOT EXISTS covid_daily_counties (
+    covid_daily_counties_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    country_subdivs_3_fk int NOT NULL,
+    calendar_days_fk int NOT NULL,
+    cases int,
+    cases_delta int,
+    cases_delta_ref int,
+    cases_delta_ref_sympt int,
+    cases_7d int,
+    cases_7d_sympt int,
+    cases_7d_ref int,
+    cases_7d_ref_sympt int,
+    deaths int,
+    deaths_delta int,
+    recovered int,
+    recovered_delta int,
+    active_cases int,
+    active_cases_delta int,
+    incidence_7d float,
+    incidence_7d_sympt float,
+    incidence_7d_ref float,
+    incidence_7d_ref_sympt float,
+    last_update DATETIME,
+    unique_key VARCHAR(255) NOT NULL UNIQUE
+);
+
+CREATE TABLE IF NOT EXISTS covid_daily_agegroups (
+    covid_daily_agegroups_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    countries_fk int NOT NULL,
+    calendar_days_fk int NOT NULL,
+    agegroups_rki_fk int NOT NULL,
+    cases int,
+    cases_delta int,
+    cases_delta_ref int,
+    cases_delta_ref_sympt int,
+    cases_7d int,
+    cases_7d_sympt int,
+    cases_7d_ref int,
+    cases_7d_ref_sympt int,
+    deaths int,
+    deaths_delta int,
+    recovered int,
+    recovered_delta int,
+    active_cases int,
+    active_cases_delta int,
+    incidence_7d float,
+    incidence_7d_sympt float,
+    incidence_7d_ref float,
+    incidence_7d_ref_sympt float,
+    last_update DATETIME,
+    unique_key VARCHAR(255) NOT NULL UNIQUE
+);
+
+CREATE TABLE IF NOT EXISTS covid_weekly_cumulative (
+    covid_weekly_cumulative_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    countries_fk int NOT NULL,
+    calendar_weeks_fk int NOT NULL,
+    cases int,
+    cases_delta int,
+    cases_delta_ref int,
+    cases_delta_ref_sympt int,
+    deaths int,
+    deaths_delta int,
+    recovered int,
+    recovered_delta int,
+    active_cases int,
+    active_cases_delta int,
+    last_update DATETIME,
+    unique_key VARCHAR(255) NOT NULL UNIQUE
+);
+
+CREATE TABLE IF NOT EXISTS covid_annual (
+    covid_annual_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    countries_fk int NOT NULL,
+    calendar_years_fk int NOT NULL,
+    cases int,
+    deaths int,
+    recovered int,
+    active_cases int,
+    last_update DATETIME,
+    unique_key VARCHAR(255) NOT NULL UNIQUE
+);
+
+-- optional, calendar_months_fk is a yyyymm key without a dimension table
+CREATE TABLE IF NOT EXISTS covid_monthly (
+    covid_monthly_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    countries_fk int NOT NULL,
+    calendar_years_fk int NOT NULL,
+    calendar_months_fk int NOT NULL,
+    cases int,
+    deaths int,
+    recovered int,
+    active_cases int,
+    last_update DATETIME,
+    unique_key VARCHAR(255) NOT NULL UNIQUE
+);
+
+CREATE TABLE IF NOT EXISTS rvalue_daily (
+    rvalue_daily_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    countries_fk int NOT NULL,
+    calendar_days_fk int NOT NULL,
+    point_estimation_covid int,
+    ll_prediction_interval_covid int,
+    ul_prediction_interval_covid int,
+    point_estimation_covid_smoothed int,
+    ll_prediction_interval_covid_smoothed int,
+    ul_prediction_interval_covid_smoothed int,
+    point_estimation_7_day_rvalue double,
+    ll_prediction_interval_7_day_rvalue double,
+    ul_prediction_interval_7_day_rvalue double,
+    last_update DATETIME,
+    unique_key VARCHAR(255) NOT NULL UNIQUE
+);
+
+CREATE TABLE IF NOT EXISTS tests_weekly (
+    tests_weekly_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    countries_fk int NOT NULL,
+    calendar_weeks_fk int NOT NULL,
+    amount int,
+    positive int,
+    positive_percentage float,
+    amount_transferring_laboratories int,
+    last_update DATETIME,
+    unique_key VARCHAR(255) NOT NULL UNIQUE
+);
+
+-- vaccinations
+
+CREATE TABLE IF NOT EXISTS vaccinations_daily (
+    vaccinations_daily_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    calendar_days_fk int NOT NULL,
+    countries_fk int NOT NULL,
+    total_vaccinations int,
+    first_vaccinated int,
+    second_vaccinated int,
+    booster_vaccinated int,
+    new_doses_raw int,
+    new_doses_7d_smoothed int,
+    total_rate float,
+    first_rate float,
+    second_rate float,
+    booster_rate float,
+    daily_vaccinated_first_shot int,
+    daily_vaccinated_first_shot_rate float,
+    last_update DATETIME,
+    unique_key VARCHAR(255) NOT NULL UNIQUE
+);
+
+CREATE TABLE IF NOT EXISTS vaccinations_daily_manufacturer (
+    vaccinations_daily_manufacturer_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    calendar_days_fk int NOT NULL,
+    countries_fk int NOT NULL,
+    vaccines_fk int NOT NULL,
+    total_vaccinations int,
+    last_update DATETIME,
+    unique_key VARCHAR(255) NOT NULL UNIQUE
+);
+
+CREATE TABLE IF NOT EXISTS vaccinations_daily_states (
+    vaccinations_daily_states_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    country_subdivs_1_fk int NOT NULL,
+    calendar_days_fk int NOT NULL,
+    vaccines_fk int NOT NULL,
+    vaccine_series_fk int,
+    amount int,
+    last_update DATETIME,
+    unique_key VARCHAR(255) NOT NULL UNIQUE
+);
+
+-- intensive care units and hospitals
+
+CREATE TABLE IF NOT EXISTS itcu_daily_counties (
+    itcu_daily_counties_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    country_subdivs_3_fk int NOT NULL,
+    calendar_days_fk int NOT NULL,
+    amount_hospital_locations int,
+    amount_reporting_areas int,
+    cases_covid int,
+    cases_covid_invasive_ventilated int,
+    itcu_free int,
+    itcu_free_adults int,
+    itcu_occupied int,
+    itcu_occupied_adults int,
+    last_update DATETIME,
+    unique_key VARCHAR(255) NOT NULL UNIQUE
+);
+
+CREATE TABLE IF NOT EXISTS itcu_daily_states (
+    itcu_daily_states_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    country_subdivs_1_fk int NOT NULL,
+    calendar_days_fk int NOT NULL,
+    treatment_group VARCHAR(100),
+    amount_reporting_areas int,
+    cases_covid int,
+    itcu_occupied int,
+    itcu_free int,
+    "7_day_emergency_reserve" int,
+    free_capacities_invasive_treatment int,
+    free_capacities_invasive_treatment_covid int,
+    operating_situation_regular int,
+    operating_situation_partially_restricted int,
+    operating_situation_restricted int,
+    operating_situation_not_specified int,
+    cases_covid_initial_reception int,
+    last_update DATETIME,
+    unique_key VARCHAR(255) NOT NULL UNIQUE
+);
+
+CREATE TABLE IF NOT EXISTS hospitals_annual (
+    hospitals_annual_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    countries_fk int NOT NULL,
+    calendar_years_fk int NOT NULL,
+    amount_hospitals int,
+    amount_beds int,
+    amount_beds_per_100000_population int,
+    amount_patients int,
+    amount_patients_per_100000_population int,
+    occupancy_days int,
+    avg_days_of_hospitalization double,
+    avg_bed_occupancy_percent double,
+    last_update DATETIME,
+    unique_key VARCHAR(255) NOT NULL UNIQUE
+);
+
+CREATE TABLE IF NOT EXISTS hospitals_staff_annual (
+    hospitals_staff_annual_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    countries_fk int NOT NULL,
+    calendar_years_fk int NOT NULL,
+    total_staff int,
+    full_time_doctors int,
+    non_medical_staff int,
+    non_medical_staff_in_nursing_service int,
+    last_update DATETIME,
+    unique_key VARCHAR(255) NOT NULL UNIQUE
+);
+
+-- mortalities
+
+CREATE TABLE IF NOT EXISTS deaths_weekly_agegroups (
+    deaths_weekly_agegroups_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    countries_fk int NOT NULL,
+    calendar_weeks_fk int NOT NULL,
+    agegroups_10y_fk int NOT NULL,
+    deaths int,
+    last_update DATETIME,
+    unique_key VARCHAR(255) NOT NULL UNIQUE
+);
+
+CREATE TABLE IF NOT EXISTS death_causes_annual_agegroups (
+    death_causes_annual_agegroups_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    countries_fk int NOT NULL,
+    calendar_years_fk int NOT NULL,
+    agegroups_10y_fk int NOT NULL,
+    classifications_icd10_fk int NOT NULL,
+    deaths int,
+    last_update DATETIME,
+    unique_key VARCHAR(255) NOT NULL UNIQUE
+);
+
+-- populations
+
+CREATE TABLE IF NOT EXISTS population_countries (
+    population_countries_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    countries_fk int NOT NULL,
+    calendar_years_fk int NOT NULL,
+    population int,
+    last_update DATETIME,
+    unique_key VARCHAR(255) NOT NULL UNIQUE
+);
+
+CREATE TABLE IF NOT EXISTS population_countries_agegroups (
+    population_countries_agegroups_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    countries_fk int NOT NULL,
+    calendar_years_fk int NOT NULL,
+    agegroups_10y_fk int NOT NULL,
+    population int,
+    last_update DATETIME,
+    unique_key VARCHAR(255) NOT NULL UNIQUE
+);
+
+CREATE TABLE IF NOT EXISTS population_subdivs_1 (
+    population_subdivs_1_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    country_subdivs_1_fk int NOT NULL,
+    calendar_years_fk int NOT NULL,
+    population int,
+    last_update DATETIME,
+    unique_key VARCHAR(255) NOT NULL UNIQUE
+);
+
+CREATE TABLE IF NOT EXISTS population_subdivs_2 (
+    population_subdivs_2_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    country_subdivs_2_fk int NOT NULL,
+    calendar_years_fk int NOT NULL,
+    population int,
+    last_update DATETIME,
+    unique_key VARCHAR(255) NOT NULL UNIQUE
+);
+
+CREATE TABLE IF NOT EXISTS population_subdivs_3 (
+    population_subdivs_3_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    country_subdivs_3_fk int NOT NULL,
+    calendar_years_fk int NOT NULL,
+    population int,
+    last_update DATETIME,
+    unique_key VARCHAR(255) NOT NULL UNIQUE
+);
+
+CREATE TABLE IF NOT EXISTS life_expectancy (
+    life_expectancy_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    countries_fk int NOT NULL,
+    calendar_years_fk int NOT NULL,
+    life_expectancy_at_birth double,
+    last_update DATETIME,
+    unique_key VARCHAR(255) NOT NULL UNIQUE
+);
+
+CREATE TABLE IF NOT EXISTS median_age (
+    median_age_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    countries_fk int NOT NULL,
+    calendar_years_fk int NOT NULL,
+    median_age double,
+    last_update DATETIME,
+    unique_key VARCHAR(255) NOT NULL UNIQUE
+);
@@ -0,0 +1,79 @@
+# Runs before the test modules import the project: config/config.yaml is read from the working directory
+# (the project root, e.g. tox -e tests), the DB config from tests/config_db.yaml
+import importlib
+import os
+import sys
+import types
+from pathlib import Path
+
+TESTS_PATH = Path(__file__).resolve().parent
+
+os.environ.setdefault('CONFIG_DB_PATH', str(TESTS_PATH))
+sys.path.insert(0, str(TESTS_PATH.parent))
+
+
+def _stub_module(name: str, **attrs):
+    # the Eurostat and Genesis clients are only used by get_data.estat and get_data.genesis
+    try:
+        importlib.import_module(name)
+    except ImportError:
+        module = types.ModuleType(name)
+        module.__dict__.update(attrs)
+        sys.modules[name] = module
+
+
+_stub_module('eurostat')
+_stub_module('pygenesis')
+_stub_module('pygenesis.py_genesis_client', PyGenesisClient=None)
+
+
+import pandas as pd  # noqa: E402
+import pytest  # noqa: E402
+
+from config.core import config_db  # noqa: E402
+from utils import db_helper as database  # noqa: E402
+from utils import outbox, parquet_sink, sql_stats  # noqa: E402
+
+# codes as stored by merge_countries_fk
+GERMANY = dict(countries_id=1, country_en='Germany', country_de='Deutschland', iso_3166_1_alpha2='de',
+               iso_3166_1_alpha3='deu', iso_3166_1_numeric=276, nuts_0='DE')
+
+
+def _reset_caches():
+    # engine, dimensions, schemas and population indexes are shared per run, i.e. per test here
+    database.dispose_engine()
+    database._dimensions.clear()
+    database._population_indexes.clear()
+    database.invalidate_schemas()
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """
+    DB on an empty SQLite file with the schema of src/sql/sqlite.sql, the calendar of 2019-2023
+    and Germany as the only country. Files written by the DB (dimension cache, outbox, parquet, logs) go to tmp_path
+    """
+    monkeypatch.setattr(config_db, 'db_name', str(tmp_path / 'test.db'))
+    monkeypatch.setattr(database, 'DIMENSION_CACHE_PATH', tmp_path / 'dimensions')
+    monkeypatch.setattr(outbox, 'OUTBOX_PATH', tmp_path / 'outbox')
+    monkeypatch.setattr(parquet_sink, 'PARQUET_PATH', tmp_path / 'parquet')
+    monkeypatch.setattr(sql_stats, 'SLOW_LOG_PATH', tmp_path / 'logs')
+    _reset_caches()
+
+    db = database.DB()
+    db.create_sqlite_schema(first_year=2019, last_year=2023)
+    pd.DataFrame([GERMANY]).to_sql('_countries', db.connection, if_exists='append', index=False)
+    yield db
+
+    db.db_close()
+    _reset_caches()
+
+
+def get_year_fk(db, year: int) -> int:
+    years = db.get_dimension('_calendar_years')
+    return int(years.loc[years['iso_year'] == year, 'calendar_years_id'].iloc[0])
+
+
+def get_day_fk(db, day: str) -> int:
+    days = db.get_dimension('_calendar_days')
+    return int(days.loc[days['iso_day'] == pd.Timestamp(day), 'calendar_days_id'].iloc[0])
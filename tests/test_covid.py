@@ -0,0 +1,48 @@
+# RKI transformations end to end on the SQLite test database
+
+import datetime as dt
+
+import pandas as pd
+import pytest
+
+from conftest import get_year_fk
+from src import covid
+
+POPULATION_DE = 83000000
+
+
+@pytest.fixture
+def rki_raw() -> pd.DataFrame:
+    # three reports of the RKI daily CSV (raw column names), all within the 7 days before 2021-03-07
+    return pd.DataFrame({
+        'IdBundesland': [1, 9, 9],
+        'IdLandkreis': [1001, 9162, 9162],
+        'Meldedatum': ['2021/03/01', '2021/03/03', '2021/03/05'],
+        'Refdatum': ['2021/02/28', '2021/03/03', '2021/03/04'],
+        'AnzahlFall': [10, 20, 30],
+        'NeuerFall': [0, 1, 0],
+        'AnzahlTodesfall': [1, 0, 2],
+        'NeuerTodesfall': [0, -9, 0],
+        'AnzahlGenesen': [5, 0, 0],
+        'NeuGenesen': [0, -9, -9],
+        'IstErkrankungsbeginn': [1, 0, 1],
+    })
+
+
+def test_rki_daily(db, rki_raw):
+    db.insert_or_update(
+        df=pd.DataFrame({'countries_fk': [1], 'calendar_years_fk': [get_year_fk(db, 2020)], 'population': [POPULATION_DE]}),
+        table='population_countries'
+    )
+
+    covid.rki_daily(df=rki_raw, date=dt.datetime(2021, 3, 7))
+
+    df = pd.read_sql('SELECT * FROM covid_daily', db.connection)
+    assert len(df) == 1
+    row = df.iloc[0]
+    assert row['countries_fk'] == 1
+    assert row['cases'] == 60
+    assert row['deaths'] == 3
+    assert row['cases_7d'] == 60
+    assert row['incidence_7d'] == pytest.approx(60 / POPULATION_DE * 100000)
+    assert row['unique_key'].startswith('1-')
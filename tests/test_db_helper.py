@@ -0,0 +1,81 @@
+# DB write and lookup paths on the SQLite test database
+
+import pandas as pd
+import pytest
+
+from config.core import config_db
+from conftest import get_day_fk, get_year_fk
+
+
+def _insert_population(db, year: int, population: int):
+    db.insert_or_update(
+        df=pd.DataFrame({'countries_fk': [1], 'calendar_years_fk': [get_year_fk(db, year)], 'population': [population]}),
+        table='population_countries'
+    )
+
+
+def test_population_index_ignores_case_of_country_code(db):
+    # the configured code is 'DE', merge_countries_fk stores 'de'
+    _insert_population(db, 2020, 83000000)
+
+    index = db.get_population_index(country='DE', country_code='iso_3166_1_alpha2')
+    population, region_fk = index.lookup(level=0, region_codes=pd.Series(['DE']), year=2020)
+
+    assert population.tolist() == [83000000]
+    assert region_fk.tolist() == [1]
+
+
+def test_population_index_raises_for_unknown_country(db):
+    _insert_population(db, 2020, 83000000)
+
+    with pytest.raises(ValueError, match='Country not found'):
+        db.get_population_index(country='FR', country_code='iso_3166_1_alpha2')
+
+
+def test_population_index_raises_without_population(db):
+    with pytest.raises(ValueError, match='No population found'):
+        db.get_population_index(country='DE', country_code='iso_3166_1_alpha2')
+
+
+def _rvalues(db, estimations: list) -> pd.DataFrame:
+    return pd.DataFrame({
+        'countries_fk': 1,
+        'calendar_days_fk': [get_day_fk(db, '2021-03-0{0}'.format(i + 1)) for i in range(len(estimations))],
+        'point_estimation_covid': estimations
+    })
+
+
+def test_insert_or_update_skips_unchanged_rows(db, monkeypatch):
+    monkeypatch.setattr(config_db, 'change_detection', ['rvalue_daily'])
+    db.add_row_hash_column('rvalue_daily')
+
+    stats = db.insert_or_update(df=_rvalues(db, [100, 200, 300]), table='rvalue_daily')
+    assert (stats['rows'], stats['inserted'], stats['updated'], stats['unchanged']) == (3, 3, 0, 0)
+
+    stats = db.insert_or_update(df=_rvalues(db, [100, 200, 300]), table='rvalue_daily')
+    assert (stats['inserted'], stats['updated'], stats['unchanged']) == (0, 0, 3)
+    assert stats['chunks'] == 0
+
+    stats = db.insert_or_update(df=_rvalues(db, [100, 250, 300, 400]), table='rvalue_daily')
+    assert (stats['inserted'], stats['updated'], stats['unchanged']) == (1, 1, 2)
+
+    df = pd.read_sql('SELECT point_estimation_covid FROM rvalue_daily ORDER BY calendar_days_fk', db.connection)
+    assert df['point_estimation_covid'].tolist() == [100, 250, 300, 400]
+
+
+def test_change_detection_needs_row_hash_column(db, monkeypatch):
+    monkeypatch.setattr(config_db, 'change_detection', ['rvalue_daily'])
+
+    with pytest.raises(ValueError, match='row_hash'):
+        db.insert_or_update(df=_rvalues(db, [100]), table='rvalue_daily')
+
+
+def test_insert_only_new_rows_is_idempotent(db):
+    assert db.insert_only_new_rows(df=_rvalues(db, [100, 200]), table='rvalue_daily') == 2
+    assert db.insert_only_new_rows(df=_rvalues(db, [100, 200]), table='rvalue_daily') == 0
+
+    # existing rows are left untouched, only the new day is appended
+    assert db.insert_only_new_rows(df=_rvalues(db, [999, 999, 300]), table='rvalue_daily') == 1
+
+    df = pd.read_sql('SELECT point_estimation_covid FROM rvalue_daily ORDER BY calendar_days_fk', db.connection)
+    assert df['point_estimation_covid'].tolist() == [100, 200, 300]
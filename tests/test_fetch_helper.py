@@ -0,0 +1,60 @@
+# Completion order and error handling of ConcurrentFetch.completed
+
+import threading
+
+import pytest
+
+from utils.fetch_helper import ConcurrentFetch
+
+
+def _fetch(value, wait_for: threading.Event = None, error: Exception = None):
+    if wait_for is not None:
+        wait_for.wait(5)
+    if error is not None:
+        raise error
+    return value
+
+
+def test_completed_yields_small_sources_before_large_one():
+    large_done = threading.Event()
+    with ConcurrentFetch({
+        'LARGE': (_fetch, dict(value='large', wait_for=large_done)),
+        'SMALL_1': (_fetch, dict(value='small 1')),
+        'SMALL_2': (_fetch, dict(value='small 2')),
+    }, workers=3, timeout=10) as sources:
+        names = []
+        for name, df in sources.completed():
+            names.append(name)
+            if len(names) == 2:
+                large_done.set()
+
+    assert sorted(names[:2]) == ['SMALL_1', 'SMALL_2']
+    assert names[2] == 'LARGE'
+
+
+def test_completed_raises_after_the_other_sources():
+    with ConcurrentFetch({
+        'FAILING': (_fetch, dict(value=None, error=IOError('connection reset'))),
+        'OK': (_fetch, dict(value='ok')),
+    }, workers=2, timeout=10) as sources:
+        names = []
+        with pytest.raises(IOError, match='connection reset'):
+            for name, df in sources.completed():
+                names.append(name)
+
+    assert names == ['OK']
+
+
+def test_completed_gives_up_hung_source():
+    released = threading.Event()
+    with ConcurrentFetch({
+        'HUNG': (_fetch, dict(value='hung', wait_for=released)),
+        'OK': (_fetch, dict(value='ok')),
+    }, workers=2, timeout=0.5) as sources:
+        names = []
+        with pytest.raises(TimeoutError, match='HUNG'):
+            for name, df in sources.completed():
+                names.append(name)
+    released.set()
+
+    assert names == ['OK']
@@ -0,0 +1,154 @@
+# Resumable downloads of get_data.http_frame against a local HTTP server that cuts off response bodies
+
+import http.server
+import json
+import socket
+import threading
+from pathlib import Path
+
+import pytest
+
+from config.core import config
+from utils import get_data
+
+BODY = b''.join(b'%d,row %d\n' % (i, i) for i in range(20000))
+ETAG = '"v1"'
+
+
+class RangeHandler(http.server.BaseHTTPRequestHandler):
+    # Serves server.body with an ETag, Range/If-Range and 416 like a static file server.
+    # The first server.drops responses are cut off after a third of their body.
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        server = self.server
+        byte_range = self.headers.get('Range')
+        if_range = self.headers.get('If-Range')
+        server.requests.append((byte_range, if_range))
+
+        start = 0
+        if byte_range and (if_range is None or if_range == server.etag):
+            start = int(byte_range.split('=')[1].split('-')[0])
+            if start >= len(server.body):
+                self.send_response(416)
+                self.send_header('Content-Range', 'bytes */{0}'.format(len(server.body)))
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header('Content-Range', 'bytes {0}-{1}/{2}'.format(start, len(server.body) - 1, len(server.body)))
+        else:
+            self.send_response(200)
+
+        data = server.body[start:]
+        self.send_header('ETag', server.etag)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+
+        if server.drops > 0:
+            server.drops -= 1
+            self.wfile.write(data[:len(data) // 3])
+            self.wfile.flush()
+            self.close_connection = True
+            self.connection.shutdown(socket.SHUT_RDWR)
+            return
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server(tmp_path, monkeypatch):
+    monkeypatch.setattr(get_data, 'DOWNLOADS_PATH', tmp_path / 'downloads')
+    monkeypatch.setattr(config.data, 'http_cache', False)
+    monkeypatch.setattr(config.data, 'download_chunk_size', 4096)
+    monkeypatch.setattr(config.data, 'download_resume_retries', 5)
+
+    httpd = http.server.ThreadingHTTPServer(('127.0.0.1', 0), RangeHandler)
+    httpd.body = BODY
+    httpd.etag = ETAG
+    httpd.drops = 0
+    httpd.requests = []
+    httpd.url = 'http://127.0.0.1:{0}/data.csv'.format(httpd.server_port)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def _read_bytes(file: Path, encoding: str) -> bytes:
+    return file.read_bytes()
+
+
+def _write_partial_file(url: str, content: bytes, etag: str = ETAG):
+    # what an earlier, aborted run leaves in files/downloads
+    part_file, meta_file = get_data._part_files(url)
+    get_data.DOWNLOADS_PATH.mkdir(parents=True, exist_ok=True)
+    part_file.write_bytes(content)
+    with open(meta_file, 'w') as f:
+        json.dump({'url': url, 'etag': etag, 'last_modified': None, 'length': len(BODY)}, f)
+
+
+def _assert_cleaned_up():
+    assert list(get_data.DOWNLOADS_PATH.iterdir()) == []
+
+
+def test_resumes_after_dropped_connections(server):
+    server.drops = 2
+
+    assert get_data.http_frame(server.url, parse=_read_bytes, resumable=True) == BODY
+
+    assert len(server.requests) == 3
+    assert server.requests[0] == (None, None)
+    for byte_range, if_range in server.requests[1:]:
+        assert byte_range.startswith('bytes=') and byte_range != 'bytes=0-'
+        assert if_range == ETAG
+    _assert_cleaned_up()
+
+
+def test_continues_partial_file_of_earlier_run(server):
+    _write_partial_file(server.url, BODY[:5000])
+
+    assert get_data.http_frame(server.url, parse=_read_bytes, resumable=True) == BODY
+
+    assert server.requests == [('bytes=5000-', ETAG)]
+    _assert_cleaned_up()
+
+
+def test_keeps_partial_file_when_retries_are_exhausted(server):
+    server.drops = 3
+
+    with pytest.raises(IOError):
+        get_data.download_resumable(
+            server.url, get_data.get_session().get(server.url, stream=True), retries=2
+        )
+
+    part_file, _ = get_data._part_files(server.url)
+    received = part_file.stat().st_size
+    assert 0 < received < len(BODY)
+
+    # the next run continues where this one stopped
+    server.requests.clear()
+    assert get_data.http_frame(server.url, parse=_read_bytes, resumable=True) == BODY
+    assert server.requests == [('bytes={0}-'.format(received), ETAG)]
+    _assert_cleaned_up()
+
+
+def test_starts_over_if_etag_changed(server):
+    _write_partial_file(server.url, b'outdated content', etag='"v0"')
+
+    assert get_data.http_frame(server.url, parse=_read_bytes, resumable=True) == BODY
+
+    # If-Range does not match, the server sends the whole file
+    assert server.requests == [('bytes=16-', '"v0"')]
+    _assert_cleaned_up()
+
+
+def test_starts_over_on_416(server):
+    _write_partial_file(server.url, BODY + b'trailing bytes')
+
+    assert get_data.http_frame(server.url, parse=_read_bytes, resumable=True) == BODY
+
+    assert server.requests == [('bytes={0}-'.format(len(BODY) + 14), ETAG), (None, None)]
+    _assert_cleaned_up()
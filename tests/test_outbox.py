@@ -0,0 +1,41 @@
+# Spooling writes to the outbox and replaying them into the SQLite test database
+
+import pandas as pd
+
+from config.core import config_db
+from conftest import get_day_fk
+from utils import outbox
+
+
+def _rvalues(db, estimations: dict) -> pd.DataFrame:
+    return pd.DataFrame({
+        'countries_fk': 1,
+        'calendar_days_fk': [get_day_fk(db, day) for day in estimations],
+        'point_estimation_covid': list(estimations.values())
+    })
+
+
+def _count(db) -> int:
+    return int(pd.read_sql('SELECT COUNT(*) AS n FROM rvalue_daily', db.connection)['n'].iloc[0])
+
+
+def test_replay_writes_spooled_batches(db, monkeypatch):
+    monkeypatch.setattr(config_db, 'outbox_mode', 'always')
+    db.insert_or_update(df=_rvalues(db, {'2021-03-01': 100, '2021-03-02': 200}), table='rvalue_daily')
+    # the later batch wins for the same day
+    db.insert_or_update(df=_rvalues(db, {'2021-03-02': 250, '2021-03-03': 300}), table='rvalue_daily')
+
+    assert _count(db) == 0
+    assert [(manifest['table'], manifest['rows']) for manifest in outbox.pending()] == \
+        [('rvalue_daily', 2), ('rvalue_daily', 2)]
+
+    written = outbox.replay(db)
+
+    assert written == {'rvalue_daily': 3}
+    assert outbox.pending() == []
+    df = pd.read_sql('SELECT point_estimation_covid FROM rvalue_daily ORDER BY calendar_days_fk', db.connection)
+    assert df['point_estimation_covid'].tolist() == [100, 250, 300]
+
+    # replaying an empty outbox writes nothing
+    assert outbox.replay(db) == {}
+    assert _count(db) == 3
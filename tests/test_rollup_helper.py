@@ -0,0 +1,44 @@
+# Incremental annual rollup of covid_daily into covid_annual on the SQLite test database
+
+import pandas as pd
+
+from utils import rollup_helper
+
+# cumulative values of the last day of 2020, 2021 and 2022
+SNAPSHOTS = {'2020-12-31': 100, '2021-12-31': 250, '2022-12-31': 300}
+
+
+def _insert_daily(db, snapshots: dict):
+    df = pd.DataFrame({'countries_fk': 1, 'date': pd.to_datetime(list(snapshots)), 'cases': list(snapshots.values())})
+    db.insert_or_update(df=db.merge_calendar_days_fk(df=df, left_on='date'), table='covid_daily')
+
+
+def _annual_cases(db) -> list:
+    df = pd.read_sql(
+        '''
+        SELECT _calendar_years.iso_year, covid_annual.cases FROM covid_annual
+        INNER JOIN _calendar_years ON covid_annual.calendar_years_fk = _calendar_years.calendar_years_id
+        ORDER BY _calendar_years.iso_year
+        ''',
+        db.connection
+    )
+    return list(df.itertuples(index=False, name=None))
+
+
+def test_rollup_recomputes_touched_years_only(db):
+    _insert_daily(db, SNAPSHOTS)
+    # written before the first rollup
+    db.connection.execute("UPDATE covid_daily SET last_update = '2020-01-01 00:00:00'")
+
+    result = rollup_helper.rollup(db, 'covid_daily', 'covid_annual', ['countries_fk'])
+    assert result['periods'] == [(2020,), (2021,), (2022,)]
+    assert _annual_cases(db) == [(2020, 100), (2021, 150), (2022, 50)]
+
+    # nothing written since
+    assert rollup_helper.rollup(db, 'covid_daily', 'covid_annual', ['countries_fk'])['periods'] == []
+
+    # a late correction of 2021 also changes the delta of 2022
+    _insert_daily(db, {'2021-12-31': 270})
+    result = rollup_helper.rollup(db, 'covid_daily', 'covid_annual', ['countries_fk'])
+    assert result['periods'] == [(2021,), (2022,)]
+    assert _annual_cases(db) == [(2020, 100), (2021, 170), (2022, 30)]
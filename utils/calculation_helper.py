@@ -1,4 +1,5 @@
 import datetime as dt
+from typing import Union
 
 import pandas as pd
 
@@ -22,6 +23,14 @@ NUTS_0 = config_db.cols['_countries']['nuts_0']
 ISO_3166_1_ALPHA2 = config_db.cols['_countries']['iso_3166_1_alpha2']
 AGS = config_db.cols['_country_subdivs_3']['ags']
 BUNDESLAND_ID = config_db.cols['_country_subdivs_1']['bundesland_id']
+CASES_7D_COLS = ['cases_7d', 'cases_7d_sympt', 'cases_7d_ref', 'cases_7d_ref_sympt']
+
+
+def get_incidence_columns(years: list) -> list:
+    # per-year incidence columns, only written if more than one reference year is configured
+    if len(years) < 2:
+        return []
+    return [col.replace('cases', 'incidence') + '_' + str(year) for year in years for col in CASES_7D_COLS]
 
 
 def rki_calc_numbers(df: pd.DataFrame, date: dt.datetime) -> pd.DataFrame:
@@ -153,44 +162,64 @@ def rki_calc_numbers(df: pd.DataFrame, date: dt.datetime) -> pd.DataFrame:
     return tmp
 
 
-def rki_calc_7d_incidence(df: pd.DataFrame, level: int, reference_year: str) -> pd.DataFrame:
+def rki_calc_7d_incidence(df: pd.DataFrame, level: int, reference_year: Union[str, list],
+                          db: database.DB = None) -> pd.DataFrame:
+    """
+    Adds 7-day incidences per 100.000 population
+
+    :param df: Dataframe with cases_7d* columns
+    :param level: 0: country (geo), 1: states (bundesland_id), 3: counties (ags)
+    :param reference_year: Population reference year, or a list of them. The first year fills
+        incidence_7d, incidence_7d_sympt, incidence_7d_ref and incidence_7d_ref_sympt. With a list,
+        every year additionally gets suffixed columns (e.g. incidence_7d_2021), which are written
+        to every table that has them
+    :param db: Open DB connection to reuse
+    :return: pd.Dataframe
+    """
+
     tmp = df.copy()
+    years = [reference_year] if isinstance(reference_year, str) else list(reference_year)
+
+    # reuse the caller's connection if given
+    close_db = db is None
+    if close_db:
+        db = database.DB()
 
-    # create db connection
-    db = database.DB()
+    # population of all levels and years is loaded once per run
+    population_index = db.get_population_index(country='DE', country_code=ISO_3166_1_ALPHA2)
 
     if level == 3:
-        df_population = db.get_population(country='DE', country_code=ISO_3166_1_ALPHA2, level=3, year=reference_year)
-        # merge states population
-        tmp = tmp.merge(df_population,
-                        left_on=SUBDIVISION_2_ID,
-                        right_on=AGS,
-                        how='left',
-                        )
-        tmp = tmp[tmp['country_subdivs_3_fk'].notna()]
+        region_col = SUBDIVISION_2_ID  # ags
     elif level == 1:
-        df_population = db.get_population(country='DE', country_code=ISO_3166_1_ALPHA2, level=1, year=reference_year)
-        tmp = tmp.merge(df_population,
-                        left_on=BUNDESLAND_ID,
-                        right_on=BUNDESLAND_ID,
-                        how='left',
-                        )
-        tmp = tmp[tmp['country_subdivs_1_fk'].notna()]
+        region_col = BUNDESLAND_ID
     else:
-        df_population = db.get_population(country='DE', country_code=ISO_3166_1_ALPHA2, level=0, year=reference_year)
-        tmp = tmp.merge(df_population,
-                        left_on='geo',
-                        right_on=NUTS_0,
-                        how='left',
-                        )
-
-    # incidence 7 days
-    tmp['incidence_7d'] = (tmp['cases_7d'] / tmp['population']) * 100000
-    tmp['incidence_7d_sympt'] = (tmp['cases_7d_sympt'] / tmp['population']) * 100000
-    tmp['incidence_7d_ref'] = (tmp['cases_7d_ref'] / tmp['population']) * 100000
-    tmp['incidence_7d_ref_sympt'] = (tmp['cases_7d_ref_sympt'] / tmp['population']) * 100000
-
-    db.db_close()
+        level = 0
+        region_col = 'geo'  # nuts_0
+
+    # population matrix: one row per df-row, one column per reference year
+    population, region_fks = population_index.lookup_years(
+        level=level, region_codes=tmp[region_col], years=years
+    )
+
+    region_fk = database.POPULATION_REGION_FKS[level]
+    tmp['population'] = population[:, 0]
+    tmp[region_fk] = region_fks[:, 0]
+
+    # incidence 7 days for all case columns and reference years in one broadcast
+    incidences = tmp[CASES_7D_COLS].to_numpy(dtype=float)[:, :, None] / population[:, None, :] * 100000
+
+    for i, cases_col in enumerate(CASES_7D_COLS):
+        incidence_col = cases_col.replace('cases', 'incidence')
+        tmp[incidence_col] = incidences[:, i, 0]
+        if len(years) > 1:
+            for j, year in enumerate(years):
+                tmp[incidence_col + '_' + str(year)] = incidences[:, i, j]
+
+    if level != 0:
+        tmp = tmp[tmp[region_fk].notna()]
+
+    if close_db:
+        db.db_close()
 
     return tmp
 
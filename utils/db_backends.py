@@ -0,0 +1,215 @@
+import os
+import tempfile
+
+import pandas as pd
+from sqlalchemy import create_engine
+from sqlalchemy.dialects import mysql, sqlite
+from sqlalchemy.sql import column, table, text
+
+from config.core import config_db
+
+
+class Backend:
+    """
+    Database-specific parts of DB: engine creation, upserts, staging tables for bulk loads
+    and schema changes. Table reads and dimension lookups are plain SQLAlchemy/pandas and
+    shared by all backends.
+    """
+    name = None
+    # maximum number of bind parameters per statement, None for no limit
+    max_params = None
+    # whether columns can be changed in place (migrate_unique_key)
+    supports_alter_column = False
+
+    def create_engine(self):
+        raise NotImplementedError
+
+    def upsert_statement(self, table_obj, rows: list, cols: list):
+        raise NotImplementedError
+
+    def merge_statement(self, table_name: str, staging: str, cols: list) -> str:
+        raise NotImplementedError
+
+    def create_staging_table(self, connection, table_name: str) -> str:
+        raise NotImplementedError
+
+    def load_staging_table(self, connection, staging: str, df: pd.DataFrame, cols: list):
+        raise NotImplementedError
+
+    def drop_staging_table(self, connection, staging: str):
+        raise NotImplementedError
+
+    def truncate_table(self, connection, table_name: str):
+        raise NotImplementedError
+
+    def add_column_statement(self, table_name: str, col: str, col_type: str, after: str = None) -> str:
+        return "ALTER TABLE " + table_name + " ADD COLUMN " + col + " " + col_type + ";"
+
+    def chunk_size(self, chunk_size: int, cols: list) -> int:
+        # rows per multi-row statement, capped by the bind parameter limit
+        if self.max_params is None:
+            return chunk_size
+        return max(1, min(chunk_size, self.max_params // max(1, len(cols))))
+
+    def read_table(self, connection, table_name: str) -> pd.DataFrame:
+        return pd.read_sql("SELECT * FROM " + table_name, connection)
+
+    def is_retryable(self, error: Exception) -> bool:
+        # whether a failed write transaction can simply be repeated (deadlocks, lock timeouts)
+        return False
+
+
+class MySQLBackend(Backend):
+    name = 'mysql'
+    supports_alter_column = True
+
+    def create_engine(self):
+        return create_engine(
+            config_db.login['dialect'] +
+            config_db.login['username'] +
+            ':' +
+            config_db.login['password'] +
+            '@' +
+            config_db.login['ip'] +
+            config_db.db_name,
+            connect_args={'local_infile': True},  # needed for LOAD DATA LOCAL INFILE (bulk strategy)
+            pool_size=config_db.pool_size,
+            pool_recycle=config_db.pool_recycle,
+            pool_pre_ping=True
+        )
+
+    def upsert_statement(self, table_obj, rows: list, cols: list):
+        # insert or update (on duplicate key)
+        # A candidate row will only be inserted if that row does not match an
+        # existing primary or unique key in the table; otherwise, an UPDATE will be performed.
+        # https://docs.sqlalchemy.org/en/14/dialects/mysql.html
+        query = mysql.insert(table_obj).values(rows)
+        return query.on_duplicate_key_update(
+            {col: query.inserted[col] for col in cols}
+        )
+
+    def merge_statement(self, table_name: str, staging: str, cols: list) -> str:
+        return \
+            "INSERT INTO " + table_name + " (" + ", ".join(cols) + ") " + \
+            "SELECT " + ", ".join(cols) + " FROM " + staging + " " + \
+            "ON DUPLICATE KEY UPDATE " + ", ".join(col + " = VALUES(" + col + ")" for col in cols) + \
+            ";"
+
+    def create_staging_table(self, connection, table_name: str) -> str:
+        # Temporary tables are only visible to this connection and vanish with it.
+        # CREATE ... LIKE copies columns and indexes, but no foreign keys.
+        staging = table_name + "_staging"
+        self.drop_staging_table(connection, staging)
+        connection.execute("CREATE TEMPORARY TABLE " + staging + " LIKE " + table_name + ";")
+        return staging
+
+    def load_staging_table(self, connection, staging: str, df: pd.DataFrame, cols: list):
+        fd, path = tempfile.mkstemp(suffix='.csv')
+        os.close(fd)
+        try:
+            df.to_csv(path, sep=",", index=False, header=False, encoding='utf8',
+                      date_format='%Y-%m-%d %H:%M:%S')
+            query = \
+                "LOAD DATA LOCAL INFILE :path INTO TABLE " + staging + " " + \
+                "CHARACTER SET utf8mb4 " + \
+                "FIELDS TERMINATED BY ',' OPTIONALLY ENCLOSED BY '\"' " + \
+                "LINES TERMINATED BY '" + os.linesep.replace("\r", "\\r").replace("\n", "\\n") + "' " + \
+                "(" + ", ".join(cols) + ")" + \
+                ";"
+            connection.execute(text(query), path=path)
+        finally:
+            os.remove(path)
+
+    def drop_staging_table(self, connection, staging: str):
+        connection.execute("DROP TEMPORARY TABLE IF EXISTS " + staging + ";")
+
+    def truncate_table(self, connection, table_name: str):
+        connection.execute("TRUNCATE TABLE " + table_name + ";")
+
+    def add_column_statement(self, table_name: str, col: str, col_type: str, after: str = None) -> str:
+        query = "ALTER TABLE " + table_name + " ADD COLUMN " + col + " " + col_type
+        if after is not None:
+            query += " AFTER " + after
+        return query + ";"
+
+    def is_retryable(self, error: Exception) -> bool:
+        # 1213: deadlock found when trying to get lock, 1205: lock wait timeout exceeded
+        # both roll back the transaction, which can then be repeated as a whole
+        orig = getattr(error, 'orig', None)
+        return orig is not None and bool(orig.args) and orig.args[0] in (1205, 1213)
+
+
+class SQLiteBackend(Backend):
+    """
+    Embedded backend for local runs and benchmarks, e.g. dialect 'sqlite:///' with db_name 'files/corona.db'.
+    The schema (src/sql/sqlite.sql) is created with main.py --procedure create_sqlite_schema,
+    including the UNIQUE index on unique_key that the ON CONFLICT upserts rely on.
+    """
+    name = 'sqlite'
+    # SQLITE_MAX_VARIABLE_NUMBER of SQLite >= 3.32
+    max_params = 32766
+
+    def create_engine(self):
+        # no credentials; file databases are not pooled by SQLAlchemy 1.4
+        return create_engine(config_db.login['dialect'] + config_db.db_name)
+
+    def upsert_statement(self, table_obj, rows: list, cols: list):
+        # https://docs.sqlalchemy.org/en/14/dialects/sqlite.html#insert-on-conflict-upsert
+        query = sqlite.insert(table_obj).values(rows)
+        return query.on_conflict_do_update(
+            index_elements=['unique_key'],
+            set_={col: query.excluded[col] for col in cols if col != 'unique_key'}
+        )
+
+    def merge_statement(self, table_name: str, staging: str, cols: list) -> str:
+        # 'WHERE true' resolves the parsing ambiguity between a join and the upsert clause
+        return \
+            "INSERT INTO " + table_name + " (" + ", ".join(cols) + ") " + \
+            "SELECT " + ", ".join(cols) + " FROM " + staging + " WHERE true " + \
+            "ON CONFLICT (unique_key) DO UPDATE SET " + \
+            ", ".join(col + " = excluded." + col for col in cols if col != 'unique_key') + \
+            ";"
+
+    def create_staging_table(self, connection, table_name: str) -> str:
+        # temp tables are only visible to this connection, no indexes needed for the merge
+        staging = table_name + "_staging"
+        self.drop_staging_table(connection, staging)
+        connection.execute("CREATE TEMP TABLE " + staging + " AS SELECT * FROM " + table_name + " WHERE 0;")
+        return staging
+
+    def load_staging_table(self, connection, staging: str, df: pd.DataFrame, cols: list):
+        # No file loader in SQLite, a single executemany is the fastest path.
+        # The staging columns are untyped here, so datetimes are passed in SQLAlchemy's storage format.
+        tmp = df.copy()
+        for col in tmp.select_dtypes(include='datetime').columns:
+            tmp[col] = tmp[col].dt.strftime('%Y-%m-%d %H:%M:%S.%f')
+
+        query = table(staging, *[column(col) for col in tmp.columns]).insert()
+        with connection.begin():
+            connection.execute(query, tmp.to_dict('records'))
+
+    def drop_staging_table(self, connection, staging: str):
+        connection.execute("DROP TABLE IF EXISTS temp." + staging + ";")
+
+    def truncate_table(self, connection, table_name: str):
+        connection.execute("DELETE FROM " + table_name + ";")
+
+    def is_retryable(self, error: Exception) -> bool:
+        # concurrent writers on one database file
+        return 'database is locked' in str(getattr(error, 'orig', error))
+
+
+BACKENDS = {
+    'mysql': MySQLBackend,
+    'sqlite': SQLiteBackend
+}
+
+
+def get_backend() -> Backend:
+    # picked by the dialect of the DB config, e.g. 'mysql+pymysql://' or 'sqlite:///'
+    name = config_db.login['dialect'].split('+')[0].split(':')[0]
+
+    if name not in BACKENDS:
+        raise ValueError("Invalid database dialect. Expected one of: {0} ".format(list(BACKENDS)))
+
+    return BACKENDS[name]()
@@ -1,42 +1,436 @@
+import json
+import queue
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
 
 import numpy as np
 import pandas as pd
-from sqlalchemy import Table, create_engine
-from sqlalchemy.dialects.mysql import insert
+from sqlalchemy import BigInteger, Table, UniqueConstraint
+from sqlalchemy.exc import OperationalError
 from sqlalchemy.schema import MetaData
-from sqlalchemy.sql import text
+from sqlalchemy.sql import bindparam, select, text
 
-from config.core import config_db
+from config.core import FILES_PATH, config_db
+from utils import outbox, parquet_sink, sql_stats
+from utils.db_backends import get_backend
 
+WRITE_STRATEGIES = ['batch', 'bulk', 'parallel']
+DIMENSION_CACHE_PATH = FILES_PATH / 'dimensions'
+DIMENSION_CACHE_VERSION = 1
+KEY_MODES = ['string', 'bigint']
+# bits reserved per foreign key when packing unique_key into a BIGINT (key_mode 'bigint')
+# can be overridden with key_bits in the DB config
+KEY_BITS = {
+    'countries_fk': 10,
+    'country_subdivs_1_fk': 12,
+    'country_subdivs_2_fk': 14,
+    'country_subdivs_3_fk': 16,
+    'calendar_years_fk': 12,
+    'calendar_weeks_fk': 14,
+    'calendar_days_fk': 17,
+    # yyyymm key of the monthly rollup (rollup_helper), not an id
+    'calendar_months_fk': 20,
+    'agegroups_05y_fk': 8,
+    'agegroups_10y_fk': 8,
+    'agegroups_rki_fk': 8,
+    'classifications_icd10_fk': 12,
+    'vaccines_fk': 10,
+    'vaccine_series_fk': 8,
+}
+KEY_BITS_DEFAULT = 16
+# meta columns are maintained by DB itself and never part of a prepared frame's content
+META_COLUMNS = ['last_update', 'unique_key', 'row_hash']
+# schema of the SQLite backend (DB.create_sqlite_schema)
+SQLITE_SCHEMA_FILE = Path(__file__).resolve().parent.parent / 'src' / 'sql' / 'sqlite.sql'
+# dimensions without a generator, imported from the local dimension cache
+SQLITE_REFERENCE_DIMENSIONS = ['_countries', '_country_subdivs_1', '_country_subdivs_2', '_country_subdivs_3',
+                               '_vaccines', '_vaccine_series', '_classifications_icd10']
 
-class DB: # MySQL DB
-    def __init__(self):
-        self.engine = create_engine(
-            config_db.login['dialect'] +
-            config_db.login['username'] +
-            ':' +
-            config_db.login['password'] +
-            '@' +
-            config_db.login['ip'] +
-            config_db.db_name
+# One pooled engine per run, shared by every DB instance
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_engine():
+    global _engine
+
+    with _engine_lock:
+        if _engine is None:
+            _engine = get_backend().create_engine()
+    return _engine
+
+
+def dispose_engine():
+    # close all pooled connections, should be called once at the end of a procedure
+    global _engine
+
+    with _engine_lock:
+        if _engine is not None:
+            _engine.dispose()
+            _engine = None
+
+
+# Dimension tables ('_'-prefixed) are read once per run and shared by every DB instance
+_dimensions = {}
+_dimensions_lock = threading.Lock()
+
+
+def _dimension_files(table: str):
+    return DIMENSION_CACHE_PATH / (table + '.ftr'), DIMENSION_CACHE_PATH / (table + '.json')
+
+
+def _read_dimension_file(table: str, rows: int = None):
+    # only use the local copy if it was written by the same cache version
+    # and still has the same row count as the table in the database (not checked if rows is None)
+    data_file, stamp_file = _dimension_files(table)
+
+    if not data_file.exists() or not stamp_file.exists():
+        return None
+
+    with open(stamp_file, 'r') as f:
+        stamp = json.load(f)
+
+    if stamp.get('version') != DIMENSION_CACHE_VERSION or (rows is not None and stamp.get('rows') != rows):
+        return None
+
+    return pd.read_feather(data_file)
+
+
+def _write_dimension_file(table: str, df: pd.DataFrame):
+    data_file, stamp_file = _dimension_files(table)
+    DIMENSION_CACHE_PATH.mkdir(parents=True, exist_ok=True)
+
+    df.reset_index(drop=True).to_feather(data_file)
+    with open(stamp_file, 'w') as f:
+        json.dump({'version': DIMENSION_CACHE_VERSION, 'rows': len(df), 'created': time.strftime('%Y-%m-%d %H:%M:%S')}, f)
+
+
+def invalidate_dimensions(table: str = None):
+    """
+    Drops cached dimension tables from memory and disk, so the next lookup reads them from the database again
+
+    :param table: Dimension table to invalidate, all cached tables if None
+    """
+
+    with _dimensions_lock:
+        tables = [table] if table else list(_dimensions.keys())
+        for t in tables:
+            _dimensions.pop(t, None)
+
+        if table:
+            files = list(_dimension_files(table))
+        else:
+            files = list(DIMENSION_CACHE_PATH.glob('_*.ftr')) + list(DIMENSION_CACHE_PATH.glob('_*.json'))
+
+        for f in files:
+            if f.exists():
+                f.unlink()
+
+
+# Population of all NUTS levels and years, loaded once per run and country
+_population_indexes = {}
+_population_indexes_lock = threading.Lock()
+
+# foreign key of the region table per NUTS level, as used by the population tables
+POPULATION_REGION_FKS = {
+    0: 'countries_fk',
+    1: 'country_subdivs_1_fk',
+    2: 'country_subdivs_2_fk',
+    3: 'country_subdivs_3_fk',
+}
+
+
+def _region_codes_to_str(codes: pd.Series) -> np.ndarray:
+    # numeric codes (ags, bundesland_id) may arrive as int, float or str
+    if pd.api.types.is_numeric_dtype(codes):
+        return codes.astype('int64').astype(str).to_numpy()
+    return codes.astype(str).to_numpy()
+
+
+class PopulationIndex:
+    """
+    Population of every region (NUTS level 0-3) and year of one country,
+    keyed by (level, region code, year) and backed by numpy arrays.
+
+    Region codes: level 0 nuts_0, level 1 bundesland_id, level 2 nuts_2, level 3 ags
+    """
+
+    def __init__(self, df: pd.DataFrame):
+        tmp = df.drop_duplicates(subset=['level', 'region_code', 'iso_year'], keep='last')
+        self._keys = pd.MultiIndex.from_arrays([
+            tmp['level'].astype('int64').to_numpy(),
+            _region_codes_to_str(tmp['region_code']),
+            tmp['iso_year'].astype('int64').to_numpy()
+        ])
+        # trailing NaN is hit by get_indexer's -1 for unknown keys
+        self._population = np.append(tmp['population'].to_numpy(dtype=float), np.nan)
+        self._region_fk = np.append(tmp['region_fk'].to_numpy(dtype=float), np.nan)
+
+    def lookup(self, level: int, region_codes: pd.Series, year) -> tuple:
+        """
+        Vectorized lookup of population and region foreign key
+
+        :param level: NUTS level (0-3)
+        :param region_codes: Region code per row
+        :param year: Reference year of the population
+        :return: (population, region_fk) as float arrays, NaN where no population is known
+        """
+
+        population, region_fk = self.lookup_years(level=level, region_codes=region_codes, years=[year])
+        return population[:, 0], region_fk[:, 0]
+
+    def lookup_years(self, level: int, region_codes: pd.Series, years: list) -> tuple:
+        """
+        Vectorized lookup of population and region foreign key for several reference years at once
+
+        :param level: NUTS level (0-3)
+        :param region_codes: Region code per row
+        :param years: Reference years of the population
+        :return: (population, region_fk) as float matrices of shape (rows, years), NaN where no population is known
+        """
+
+        n = len(region_codes)
+        keys = pd.MultiIndex.from_arrays([
+            np.full(n * len(years), level, dtype='int64'),
+            np.tile(_region_codes_to_str(region_codes), len(years)),
+            np.repeat(np.array(years, dtype='int64'), n)
+        ])
+        positions = self._keys.get_indexer(keys).reshape(len(years), n).T
+
+        return self._population[positions], self._region_fk[positions]
+
+
+# Table schemas are reflected once per run and shared by every DB instance
+_metadata = MetaData()
+_schemas = {}
+_schemas_lock = threading.Lock()
+
+
+def invalidate_schemas(table: str = None):
+    """
+    Drops cached table schemas, e.g. after a table was altered
+
+    :param table: Table to invalidate, all cached tables if None
+    """
+
+    with _schemas_lock:
+        tables = [table] if table else list(_schemas.keys())
+        for t in tables:
+            schema = _schemas.pop(t, None)
+            if schema is not None:
+                _metadata.remove(schema['table'])
+
+
+def build_unique_key(df: pd.DataFrame, foreign_keys: list) -> pd.Series:
+    # Same output as df[foreign_keys].apply(lambda row: '-'.join(row.values.astype(str)), axis=1),
+    # but every distinct foreign key value is converted to str only once (fks have few distinct values)
+    if not foreign_keys:
+        return pd.Series('', index=df.index, dtype=object)
+
+    cols = []
+    for fk in foreign_keys:
+        codes, uniques = pd.factorize(df[fk])
+        cols.append(uniques.astype(str).to_numpy(dtype=object)[codes])
+
+    return pd.Series(['-'.join(values) for values in zip(*cols)], index=df.index, dtype=object)
+
+
+def build_row_hash(df: pd.DataFrame) -> pd.Series:
+    # deterministic 64-bit content hash per row (signed, to fit a BIGINT column)
+    hashes = pd.util.hash_pandas_object(df, index=False).to_numpy().view(np.int64)
+    return pd.Series(hashes, index=df.index)
+
+
+def _get_key_bits(foreign_keys: list) -> list:
+    widths = [int(config_db.key_bits.get(fk, KEY_BITS.get(fk, KEY_BITS_DEFAULT))) for fk in foreign_keys]
+
+    if sum(widths) > 63:
+        raise ValueError(
+            "Foreign keys {0} need {1} bits, but a packed unique_key only has 63. "
+            "Adjust key_bits in the DB config".format(foreign_keys, sum(widths))
         )
-        self.connection = self.engine.connect()
+    return widths
+
+
+def build_packed_key(df: pd.DataFrame, foreign_keys: list) -> pd.Series:
+    # Packs all foreign keys into one signed 64-bit integer, first foreign key in the highest bits.
+    # Deterministic as long as the column order and key_bits do not change.
+    widths = _get_key_bits(foreign_keys)
+    unique_key = np.zeros(len(df), dtype=np.int64)
+
+    for fk, width in zip(foreign_keys, widths):
+        values = df[fk].to_numpy(dtype=np.int64)
+        if len(values) and (values.min() < 0 or values.max() >= 1 << width):
+            raise ValueError("Foreign key {0} does not fit into {1} bits. Adjust key_bits in the DB config".format(fk, width))
+        unique_key = (unique_key << width) | values
+
+    return pd.Series(unique_key, index=df.index)
+
+
+def _packed_key_sql(foreign_keys: list) -> str:
+    # SQL equivalent of build_packed_key
+    widths = _get_key_bits(foreign_keys)
+    expression = '0'
+
+    for fk, width in zip(foreign_keys, widths):
+        expression = '((' + expression + ') << ' + str(width) + ') | ' + fk
+
+    return expression
+
+
+# Optional background writer: writes are queued and executed by one thread with its own DB,
+# so the next transformation can start while the previous frame is written
+_writer = None
+_writer_lock = threading.Lock()
+
+
+class BackgroundWriter:
+    def __init__(self, queue_size: int):
+        # a bounded queue caps the memory held by frames waiting to be written
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.error = None
+        self.thread = threading.Thread(target=self._run, name='db-writer', daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        db = DB()
+        try:
+            while True:
+                item = self.queue.get()
+                try:
+                    if item is None:
+                        return
+                    # after the first failure the remaining writes are skipped
+                    if self.error is None:
+                        method, kwargs = item
+                        getattr(db, method)(**kwargs)
+                except Exception as e:
+                    self.error = e
+                finally:
+                    self.queue.task_done()
+        finally:
+            db.db_close()
+
+    def _raise_error(self):
+        if self.error is not None:
+            raise self.error
+
+    def submit(self, method: str, **kwargs):
+        # blocks while the queue is full
+        self._raise_error()
+        self.queue.put((method, kwargs))
+
+    def flush(self):
+        # waits until every queued write is done
+        self.queue.join()
+        self._raise_error()
+
+    def close(self):
+        self.queue.put(None)
+        self.thread.join()
+        self._raise_error()
+
+
+def start_writer(queue_size: int = None):
+    """
+    Starts the background writer. Until stop_writer is called, DB.insert_into, DB.insert_or_update
+    and DB.insert_only_new_rows only queue their frame and return None.
+    """
+    global _writer
+
+    if queue_size is None:
+        queue_size = config_db.writer_queue_size
+
+    if queue_size < 1:
+        raise ValueError("Invalid queue size. Expected a positive integer, got {0} ".format(queue_size))
+
+    with _writer_lock:
+        if _writer is None:
+            _writer = BackgroundWriter(queue_size)
+
+
+def flush_writer():
+    if _defer_write():
+        _writer.flush()
+
+
+def stop_writer():
+    # waits for all queued writes and re-raises the first error of the writer thread
+    global _writer
+
+    with _writer_lock:
+        writer, _writer = _writer, None
+
+    if writer is not None:
+        writer.close()
+
+
+def _defer_write() -> bool:
+    # writes are queued, unless they come from the writer thread itself
+    writer = _writer
+    return writer is not None and threading.current_thread() is not writer.thread
+
+
+class DB:
+    def __init__(self):
+        # MySQL or embedded SQLite, depending on the configured dialect
+        self.backend = get_backend()
+        self.engine = get_engine()
+        # per-table statement timings (sql_stats.summary)
+        sql_stats.attach(self.engine)
+        # connected on first use, so frames can still be spooled to the outbox while the database is down
+        self._connection = None
+        self.use_outbox = True
+
+    @property
+    def connection(self):
+        if self._connection is None:
+            self._connection = self.engine.connect()
+        return self._connection
 
     def db_close(self):
-        self.connection.close()
+        # returns the connection to the pool
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    def _write(self, method: str, **kwargs):
+        # Entry point of all writes: queued for the background writer if it runs,
+        # spooled to the outbox (outbox_mode in the DB config), or written directly
+        if _defer_write():
+            return _writer.submit(method, **kwargs)
+
+        mode = outbox.get_mode() if self.use_outbox else 'off'
+
+        if mode == 'always':
+            outbox.spool(method, **kwargs)
+            return None
+
+        try:
+            return getattr(self, '_' + method)(**kwargs)
+        except OperationalError as e:
+            if mode != 'fallback':
+                raise
+            print(kwargs['table'] + ': write failed, spooling to outbox (' + str(e.orig) + ')')
+            outbox.spool(method, **kwargs)
+            return None
 
     def truncate_table(self, table_name: str):
-        self.connection.execute("TRUNCATE TABLE " + table_name + ";")
+        self.backend.truncate_table(self.connection, table_name)
 
     def insert_into(self, df: pd.DataFrame, table: str, replace: bool, add_meta_columns: bool):
+        return self._write('insert_into', df=df, table=table, replace=replace, add_meta_columns=add_meta_columns)
+
+    def _insert_into(self, df: pd.DataFrame, table: str, replace: bool, add_meta_columns: bool):
 
         if add_meta_columns:
             # 1. sort df-columns in correct order
             # 2. add necessary meta columns (last_update, unique_key)
             tmp = (df.
                    pipe(self.sort_columns, table).
-                   pipe(self.add_meta_columns)
+                   pipe(self.add_meta_columns, key_mode=self.get_key_mode(table))
                    ).copy()
         else:
             tmp = self.sort_columns(df, table).copy()
@@ -47,36 +441,299 @@ class DB: # MySQL DB
             self.truncate_table(table)
             tmp.to_sql(table, self.connection, if_exists='append', index=False)
 
-    def insert_or_update(self, df: pd.DataFrame, table: str):
+        if parquet_sink.is_enabled(table):
+            parquet_sink.write(tmp, table, self, mode='replace')
+
+    def insert_or_update(self, df: pd.DataFrame, table: str, chunk_size: int = None, strategy: str = None,
+                         skip_unchanged: bool = None) -> dict:
+        return self._write('insert_or_update', df=df, table=table, chunk_size=chunk_size, strategy=strategy,
+                           skip_unchanged=skip_unchanged)
+
+    def _insert_or_update(self, df: pd.DataFrame, table: str, chunk_size: int = None, strategy: str = None,
+                          skip_unchanged: bool = None) -> dict:
+        start = time.perf_counter()
+
+        if chunk_size is None:
+            chunk_size = config_db.upsert_chunk_size
+
+        if chunk_size < 1:
+            raise ValueError("Invalid chunk size. Expected a positive integer, got {0} ".format(chunk_size))
+
+        if skip_unchanged is None:
+            skip_unchanged = table in config_db.change_detection
+
+        tmp = self._prepare_upsert(df, table)
+        stats = {'rows': len(tmp)}
+
+        if skip_unchanged:
+            tmp, changes = self._drop_unchanged_rows(tmp, table, chunk_size)
+            stats.update(changes)
+
+        strategy = self._get_write_strategy(table=table, rows=len(tmp), strategy=strategy)
+
+        if tmp.empty:
+            chunks = 0
+        elif strategy == 'bulk':
+            chunks = self._upsert_bulk(tmp, table)
+        elif strategy == 'parallel':
+            chunks = self._upsert_parallel(tmp, table, chunk_size)
+        else:
+            chunks = self._upsert_batch(tmp, table, chunk_size)
+
+        if parquet_sink.is_enabled(table):
+            stats['partitions'] = parquet_sink.write(tmp, table, self, mode='upsert')
+
+        stats.update({
+            'strategy': strategy,
+            'chunks': chunks,
+            'seconds': round(time.perf_counter() - start, 3)
+        })
+        return stats
+
+    def _prepare_upsert(self, df: pd.DataFrame, table: str) -> pd.DataFrame:
         # 1. sort df-columns in correct order
-        # 2. add necessary meta columns (last_update, unique_key)
+        # 2. add necessary meta columns (last_update, unique_key, row_hash if the table has one)
         tmp = (df.
                pipe(self.sort_columns, table).
-               pipe(self.add_meta_columns)
+               pipe(self.add_meta_columns, key_mode=self.get_key_mode(table))
                ).copy()
         tmp = tmp.replace([np.inf, -np.inf], np.nan)
         tmp = tmp.fillna(0)
+
+        if 'row_hash' in self.get_schema(table)['columns']:
+            tmp['row_hash'] = build_row_hash(tmp[[col for col in tmp if col not in META_COLUMNS]])
+
+        return tmp
+
+    def _drop_unchanged_rows(self, tmp: pd.DataFrame, table: str, chunk_size: int) -> tuple:
+        # compare the content hash of every prepared row against the stored one (fetched by unique_key)
+        # and only keep new or changed rows
+        if 'row_hash' not in tmp.columns:
+            raise ValueError(
+                "Change detection needs a row_hash column in {0}. "
+                "Run 'main.py --procedure add_row_hashes' first".format(table)
+            )
+
+        stored = self._get_row_hashes(table, tmp['unique_key'].tolist(), chunk_size)
+        stored['unique_key'] = stored['unique_key'].astype(tmp['unique_key'].dtype)
+        merged = tmp[['unique_key', 'row_hash']].merge(
+            stored, on='unique_key', how='left', suffixes=('', '_stored'), indicator=True
+        )
+
+        is_new = (merged['_merge'] == 'left_only').to_numpy(dtype=bool)
+        is_unchanged = (merged['row_hash'].astype('Int64') == merged['row_hash_stored']).fillna(False).to_numpy(dtype=bool)
+        is_changed = ~is_new & ~is_unchanged
+
+        changes = {
+            'inserted': int(is_new.sum()),
+            'updated': int(is_changed.sum()),
+            'unchanged': int(is_unchanged.sum())
+        }
+        return tmp[~is_unchanged], changes
+
+    def _get_row_hashes(self, table: str, unique_keys: list, chunk_size: int) -> pd.DataFrame:
+        table_obj = self.get_table_obj(table)
+        query = select(table_obj.c.unique_key, table_obj.c.row_hash).where(
+            table_obj.c.unique_key.in_(bindparam('unique_keys', expanding=True))
+        )
+
+        rows = []
+        for i in range(0, len(unique_keys), chunk_size):
+            rows += self.connection.execute(query, unique_keys=unique_keys[i:i + chunk_size]).fetchall()
+
+        # Int64 keeps NULL hashes without losing precision on the 64-bit values
+        return pd.DataFrame(
+            [tuple(row) for row in rows], columns=['unique_key', 'row_hash_stored'], dtype=object
+        ).astype({'row_hash_stored': 'Int64'})
+
+    def add_row_hash_column(self, table: str):
+        # Rows written before the column existed have no hash and are treated as changed once
+        if 'row_hash' in self.get_schema(table)['columns']:
+            print(table + ': row_hash already exists')
+            return
+
+        self.connection.execute(
+            self.backend.add_column_statement(table, 'row_hash', 'BIGINT NULL', after='unique_key')
+        )
+        invalidate_schemas(table)
+
+    def add_columns(self, table: str, columns: list, col_type: str, after: str = None):
+        # adds the missing columns in the given order, the first one after the column `after`
+        existing = self.get_schema(table)['columns']
+        for col in columns:
+            if col in existing:
+                print(table + ': ' + col + ' already exists')
+            else:
+                self.connection.execute(self.backend.add_column_statement(table, col, col_type, after=after))
+            after = col
+        invalidate_schemas(table)
+
+    def create_sqlite_schema(self, first_year: int = 2000, last_year: int = 2035):
+        # Creates the tables of src/sql/sqlite.sql and fills the calendar dimensions (ISO years, weeks, days).
+        # Countries, subdivisions, vaccines and icd10 classifications are imported from the local dimension cache
+        # (files/dimensions, e.g. copied from a MySQL run), otherwise they have to be inserted manually.
+        if self.backend.name != 'sqlite':
+            raise NotImplementedError("create_sqlite_schema is not supported by the {0} backend".format(self.backend.name))
+
+        with open(SQLITE_SCHEMA_FILE, 'r', encoding='utf-8') as f:
+            self.connection.connection.executescript(f.read())
+
+        if self._count('_calendar_days') == 0:
+            days = pd.date_range(str(first_year - 1) + '-12-01', str(last_year + 1) + '-01-31', freq='D')
+            calendar = days.isocalendar()
+            calendar = calendar[calendar['year'].between(first_year, last_year)]
+            calendar['iso_day'] = calendar.index.strftime('%Y-%m-%d')
+            calendar['iso_key'] = calendar['year'] * 100 + calendar['week']
+
+            years = pd.DataFrame({'iso_year': range(first_year, last_year + 1)})
+            years.to_sql('_calendar_years', self.connection, if_exists='append', index=False)
+            years = pd.read_sql("SELECT calendar_years_id, iso_year FROM _calendar_years", self.connection)
+
+            weeks = calendar[['year', 'week', 'iso_key']].drop_duplicates().rename(columns={'week': 'iso_week'})
+            weeks = weeks.merge(years, left_on='year', right_on='iso_year')
+            weeks = weeks.rename(columns={'calendar_years_id': 'calendar_years_fk'})
+            weeks[['calendar_years_fk', 'iso_week', 'iso_key']].astype('int64').to_sql(
+                '_calendar_weeks', self.connection, if_exists='append', index=False
+            )
+            weeks = pd.read_sql("SELECT calendar_weeks_id, iso_key FROM _calendar_weeks", self.connection)
+
+            calendar = calendar.astype({'iso_key': 'int64'}).merge(weeks, on='iso_key')
+            calendar = calendar.rename(columns={'calendar_weeks_id': 'calendar_weeks_fk'})
+            calendar[['calendar_weeks_fk', 'iso_day']].to_sql(
+                '_calendar_days', self.connection, if_exists='append', index=False
+            )
+            # cached copies of another database have different ids
+            for table in ('_calendar_years', '_calendar_weeks', '_calendar_days'):
+                invalidate_dimensions(table)
+
+        for table in SQLITE_REFERENCE_DIMENSIONS:
+            if self._count(table) > 0:
+                continue
+
+            df = _read_dimension_file(table)
+            if df is None:
+                print(table + ': no local copy in ' + str(DIMENSION_CACHE_PATH) + ', has to be filled manually')
+                continue
+
+            cols = self.get_column_names(table)
+            df[[col for col in df.columns if col in cols]].to_sql(table, self.connection, if_exists='append', index=False)
+
+        invalidate_schemas()
+
+    def _count(self, table: str) -> int:
+        return self.connection.execute(text("SELECT COUNT(*) FROM " + table + ";")).scalar()
+
+    @staticmethod
+    def get_key_mode(table: str) -> str:
+        key_mode = config_db.key_modes.get(table, 'string')
+
+        if key_mode not in KEY_MODES:
+            raise ValueError("Invalid key mode. Expected one of: {0} ".format(KEY_MODES))
+
+        return key_mode
+
+    @staticmethod
+    def _get_write_strategy(table: str, rows: int, strategy: str = None) -> str:
+        # explicit argument > per-table config > row-count threshold
+        # (large frames are written in parallel if more than one worker is configured, e.g. main.py --workers)
+        if strategy is None:
+            strategy = config_db.write_strategies.get(table)
+
+        if strategy is None:
+            if rows < config_db.bulk_load_threshold:
+                strategy = 'batch'
+            elif config_db.parallel_workers > 1:
+                strategy = 'parallel'
+            else:
+                strategy = 'bulk'
+
+        if strategy not in WRITE_STRATEGIES:
+            raise ValueError("Invalid write strategy. Expected one of: {0} ".format(WRITE_STRATEGIES))
+
+        return strategy
+
+    def _upsert_batch(self, tmp: pd.DataFrame, table: str, chunk_size: int) -> int:
         # create table object (sqlalchemy)
         table_obj = self.get_table_obj(table)
 
-        # insert or update (on duplicate key)
-        # A candidate row will only be inserted if that row does not match an
-        # existing primary or unique key in the table; otherwise, an UPDATE will be performed.
-        # https://docs.sqlalchemy.org/en/14/dialects/mysql.html
-        for index, row in tmp.iterrows():
-            row_dict = row.to_dict()
-            query = insert(table_obj, bind=self.engine).values(row_dict)
-            update_dict = query.on_duplicate_key_update(row_dict)
-            self.connection.execute(update_dict)
+        # Rows are sent as multi-row VALUES upserts (see backend), one transaction per chunk.
+        rows = tmp.to_dict('records')
+        cols = list(tmp.columns)
+        chunk_size = self.backend.chunk_size(chunk_size, cols)
+        chunks = 0
+        for i in range(0, len(rows), chunk_size):
+            query = self.backend.upsert_statement(table_obj, rows[i:i + chunk_size], cols)
+            self._execute_with_retry(query)
+            chunks += 1
+
+        return chunks
+
+    def _execute_with_retry(self, query):
+        # one transaction per call, repeated with exponential backoff if it was rolled back
+        # because of a deadlock or lock timeout (concurrent ON DUPLICATE KEY upserts)
+        for attempt in range(config_db.deadlock_retries + 1):
+            try:
+                with self.connection.begin():
+                    self.connection.execute(query)
+                return
+            except OperationalError as e:
+                if attempt == config_db.deadlock_retries or not self.backend.is_retryable(e):
+                    raise
+                time.sleep(config_db.deadlock_backoff * 2 ** attempt)
+
+    def _upsert_parallel(self, tmp: pd.DataFrame, table: str, chunk_size: int, workers: int = None) -> int:
+        # Splits the frame into contiguous unique_key ranges, one per worker, and upserts them
+        # concurrently, each worker with its own pooled connection.
+        # Disjoint key ranges keep the workers from locking the same index pages most of the time.
+        if workers is None:
+            workers = config_db.parallel_workers
+
+        if workers < 1:
+            raise ValueError("Invalid number of workers. Expected a positive integer, got {0} ".format(workers))
+
+        tmp = tmp.sort_values('unique_key')
+        parts = [tmp.iloc[idx] for idx in np.array_split(np.arange(len(tmp)), workers) if len(idx)]
+
+        def upsert_part(part: pd.DataFrame) -> int:
+            db = DB()
+            try:
+                return db._upsert_batch(part, table, chunk_size)
+            finally:
+                db.db_close()
+
+        with ThreadPoolExecutor(max_workers=len(parts), thread_name_prefix='db-loader') as executor:
+            return sum(executor.map(upsert_part, parts))
+
+    def _upsert_bulk(self, tmp: pd.DataFrame, table: str) -> int:
+        # load everything into a staging table, then merge it with one statement
+        staging = self._load_staging_table(tmp, table)
+        query = self.backend.merge_statement(table, staging, self._quote_columns(tmp.columns))
+
+        with self.connection.begin():
+            self.connection.execute(text(query))
+
+        self.backend.drop_staging_table(self.connection, staging)
+        return 1
+
+    def _load_staging_table(self, tmp: pd.DataFrame, table: str) -> str:
+        staging = self.backend.create_staging_table(self.connection, table)
+        self.backend.load_staging_table(self.connection, staging, tmp, self._quote_columns(tmp.columns))
+        return staging
+
+    def _quote_columns(self, cols) -> list:
+        preparer = self.engine.dialect.identifier_preparer
+        return [preparer.quote(col) for col in cols]
 
     @staticmethod
-    def add_meta_columns(df: pd.DataFrame):
+    def add_meta_columns(df: pd.DataFrame, key_mode: str = 'string'):
         # Create meta columns
         # last_update should be in every table
-        # unique_key is a string-concatenation of all foreign-keys
+        # unique_key is a string-concatenation of all foreign-keys,
+        # or all foreign-keys packed into one BIGINT for key_mode 'bigint'
 
         tmp = df.copy()
-        tmp['last_update'] = time.strftime('%Y-%m-%d %H:%M:%S')
+        # a datetime rather than a string, so every backend's DATETIME column accepts it
+        tmp['last_update'] = pd.Timestamp.now().floor('S')
 
         foreign_keys = [col for col in tmp if col.endswith('_fk')]
         # avoid decimals
@@ -84,23 +741,21 @@ class DB: # MySQL DB
         for fk in foreign_keys:
             tmp[fk] = tmp[fk].astype(int)
 
-        tmp['unique_key'] = tmp[foreign_keys].apply(lambda row: '-'.join(row.values.astype(str)), axis=1)
+        if key_mode == 'bigint':
+            tmp['unique_key'] = build_packed_key(tmp, foreign_keys)
+        else:
+            tmp['unique_key'] = build_unique_key(tmp, foreign_keys)
 
         return tmp
 
     # need to sort the columns in order to create correct unique_key
     def sort_columns(self, df: pd.DataFrame, table: str):
         tmp = df.copy()
-        result = self.connection.execute('SELECT * FROM ' + table)
-        cols = list(result.keys())
-        cols = [each_col.lower() for each_col in cols]  # lower all column names
+        cols = list(self.get_schema(table)['columns'])
         cols.pop(0)  # get rid of ID column
 
-        if 'last_update' in cols:
-            cols.remove('last_update')
-
-        if 'unique_key' in cols:
-            cols.remove('unique_key')
+        # get rid of meta columns (last_update, unique_key, row_hash)
+        cols = [col for col in cols if col not in META_COLUMNS]
 
         tmp.columns = [each_col.lower() for each_col in tmp.columns]  # lower column names
 
@@ -110,9 +765,33 @@ class DB: # MySQL DB
         # return tmp
         return tmp.reindex(columns=cols)
 
+    def get_schema(self, table: str) -> dict:
+        # reflect the table only once per run
+        # columns: lower column names in table order
+        # keys: primary key and unique columns
+        # types: sqlalchemy type per column
+        with _schemas_lock:
+            if table not in _schemas:
+                table_obj = Table(table, _metadata, autoload_with=self.engine)
+
+                keys = [col.name.lower() for col in table_obj.primary_key.columns]
+                for index in table_obj.indexes:
+                    if index.unique:
+                        keys += [col.name.lower() for col in index.columns if col.name.lower() not in keys]
+                for constraint in table_obj.constraints:
+                    if isinstance(constraint, UniqueConstraint):
+                        keys += [col.name.lower() for col in constraint.columns if col.name.lower() not in keys]
+
+                _schemas[table] = {
+                    'table': table_obj,
+                    'columns': [col.name.lower() for col in table_obj.columns],
+                    'keys': keys,
+                    'types': {col.name.lower(): col.type for col in table_obj.columns}
+                }
+            return _schemas[table]
+
     def get_table_obj(self, table: str):
-        meta = MetaData(bind=self.engine)
-        return Table(table, meta, autoload=True, autoload_with=self.engine)
+        return self.get_schema(table)['table']
 
     def get_table_obj_list(self):
         meta = MetaData()
@@ -121,18 +800,135 @@ class DB: # MySQL DB
         return meta.tables.keys()
 
     def get_column_names(self, table: str):
-        result = self.connection.execute('SELECT * FROM ' + table)
-        cols = list(result.keys())
-        cols = [each_col.lower() for each_col in cols]
+        return list(self.get_schema(table)['columns'])
+
+    def migrate_unique_key(self, table: str):
+        # Converts the string unique_key of an existing table into the packed BIGINT of key_mode 'bigint'.
+        # Dropping the old column also drops its unique index, which is rebuilt on the new column.
+        if not self.backend.supports_alter_column:
+            raise NotImplementedError("migrate_unique_key is not supported by the {0} backend".format(self.backend.name))
+
+        schema = self.get_schema(table)
+
+        if isinstance(schema['types'].get('unique_key'), BigInteger):
+            print(table + ': unique_key is already a BIGINT')
+            return
+
+        foreign_keys = [col for col in schema['columns'] if col.endswith('_fk')]
 
-        return cols
+        # fail before altering anything if a foreign key does not fit into its bits
+        for fk, width in zip(foreign_keys, _get_key_bits(foreign_keys)):
+            max_fk = self.connection.execute(text("SELECT MAX(" + fk + ") FROM " + table + ";")).scalar()
+            if max_fk is not None and max_fk >= 1 << width:
+                raise ValueError("Foreign key {0} of {1} does not fit into {2} bits. Adjust key_bits in the DB config".format(fk, table, width))
+
+        self.connection.execute(
+            "ALTER TABLE " + table + " ADD COLUMN unique_key_packed BIGINT NULL AFTER unique_key;"
+        )
+        self.connection.execute(
+            "UPDATE " + table + " SET unique_key_packed = " + _packed_key_sql(foreign_keys) + ";"
+        )
+        self.connection.execute(
+            "ALTER TABLE " + table + " " +
+            "DROP COLUMN unique_key, " +
+            "CHANGE COLUMN unique_key_packed unique_key BIGINT NOT NULL, " +
+            "ADD UNIQUE INDEX unique_key (unique_key);"
+        )
+        invalidate_schemas(table)
 
     def get_table(self, table: str):
-        return pd.read_sql("SELECT * FROM " + table, self.connection)
+        # fact tables may still have queued writes, dimensions are never written by the pipeline
+        if not table.startswith('_'):
+            flush_writer()
+        return self.backend.read_table(self.connection, table)
+
+    def read_table(self, table: str, columns: list = None, where: str = None, params: dict = None,
+                   chunksize: int = None):
+        """
+        Reads a table incrementally through a server-side cursor on a separate connection
+
+        :param table: Table name
+        :param columns: Columns to select, all columns if None
+        :param where: SQL predicate with named parameters, e.g. "calendar_days_fk IN :days"
+        :param params: Values of the named parameters, lists are expanded for IN-predicates
+        :param chunksize: Rows per frame, defaults to read_chunk_size of the DB config
+        :return: Generator of pd.DataFrame
+        """
+        if chunksize is None:
+            chunksize = config_db.read_chunk_size
+
+        if chunksize < 1:
+            raise ValueError("Invalid chunk size. Expected a positive integer, got {0} ".format(chunksize))
+
+        if params is None:
+            params = {}
+
+        # fact tables may still have queued writes
+        if not table.startswith('_'):
+            flush_writer()
+
+        table_obj = self.get_table_obj(table)
+        query = select(*[table_obj.c[col] for col in columns]) if columns else select(table_obj)
+
+        if where is not None:
+            predicate = text(where)
+            for name, value in params.items():
+                if isinstance(value, (list, tuple)):
+                    predicate = predicate.bindparams(bindparam(name, expanding=True))
+            query = query.where(predicate)
+
+        # the streaming result occupies its connection until it is exhausted
+        connection = self.engine.connect().execution_options(stream_results=True)
+        try:
+            result = connection.execute(query, params)
+            cols = list(result.keys())
+            while True:
+                rows = result.fetchmany(chunksize)
+                if not rows:
+                    break
+                yield pd.DataFrame(rows, columns=cols)
+        finally:
+            connection.close()
+
+    def get_dimension(self, table: str) -> pd.DataFrame:
+        # returns a copy, so callers can modify it without touching the cache
+        if not table.startswith('_'):
+            raise ValueError("Invalid dimension table. Expected a '_'-prefixed table, got {0} ".format(table))
+
+        with _dimensions_lock:
+            if table not in _dimensions:
+                _dimensions[table] = self._load_dimension(table)
+            return _dimensions[table].copy()
+
+    def _load_dimension(self, table: str) -> pd.DataFrame:
+        if config_db.dimension_cache_on_disk:
+            try:
+                rows = self.connection.execute(text("SELECT COUNT(*) FROM " + table)).scalar()
+            except OperationalError:
+                # database unreachable: the local copy is better than nothing if the outbox can take the writes
+                if outbox.get_mode() == 'off':
+                    raise
+                rows = None
+            df = _read_dimension_file(table, rows)
+            if df is not None:
+                return df
+
+        df = self.get_table(table)
+
+        if table == '_calendar_days':
+            try:
+                df['iso_day'] = pd.to_datetime(df['iso_day'], infer_datetime_format=True)
+            except (KeyError, TypeError):
+                print('Error trying to convert Date columns')
+
+        if config_db.dimension_cache_on_disk:
+            _write_dimension_file(table, df)
+
+        return df
 
     def merge_calendar_years_fk(self, df: pd.DataFrame, left_on: str):
 
-        df_calendar_years = self.get_table('_calendar_years')
+        df_calendar_years = self.get_dimension('_calendar_years')
 
         df[left_on] = df[left_on].astype(int)
 
@@ -156,7 +952,7 @@ class DB: # MySQL DB
 
     def merge_calendar_weeks_fk(self, df: pd.DataFrame, left_on: str):
 
-        df_calendar_weeks = self.get_table('_calendar_weeks')
+        df_calendar_weeks = self.get_dimension('_calendar_weeks')
 
         df[left_on] = df[left_on].astype(int)
 
@@ -180,12 +976,7 @@ class DB: # MySQL DB
 
     def merge_calendar_days_fk(self, df: pd.DataFrame, left_on: str):
 
-        df_calendar_days = self.get_table('_calendar_days')
-
-        try:
-            df_calendar_days['iso_day'] = pd.to_datetime(df_calendar_days['iso_day'], infer_datetime_format=True)
-        except (KeyError, TypeError):
-            print('Error trying to convert Date columns')
+        df_calendar_days = self.get_dimension('_calendar_days')
 
         tmp = df.merge(df_calendar_days,
                        left_on=left_on,
@@ -215,7 +1006,7 @@ class DB: # MySQL DB
         df_agegroups = None
 
         if interval == '05y':
-            df_agegroups = self.get_table('_agegroups_05y')
+            df_agegroups = self.get_dimension('_agegroups_05y')
             df_agegroups['agegroups_05y_id'] = df_agegroups['agegroups_05y_id'].astype(int)
             df_agegroups.rename(
                 columns={'agegroups_05y_id': 'agegroups_05y_fk'},
@@ -223,7 +1014,7 @@ class DB: # MySQL DB
             )
 
         if interval == '10y':
-            df_agegroups = self.get_table('_agegroups_10y')
+            df_agegroups = self.get_dimension('_agegroups_10y')
             df_agegroups['agegroups_10y_id'] = df_agegroups['agegroups_10y_id'].astype(int)
             df_agegroups.rename(
                 columns={'agegroups_10y_id': 'agegroups_10y_fk'},
@@ -231,7 +1022,7 @@ class DB: # MySQL DB
             )
 
         if interval == 'rki':
-            df_agegroups = self.get_table('_agegroups_rki')
+            df_agegroups = self.get_dimension('_agegroups_rki')
             df_agegroups['agegroups_rki_id'] = df_agegroups['agegroups_rki_id'].astype(int)
             df_agegroups.rename(
                 columns={'agegroups_rki_id': 'agegroups_rki_fk'},
@@ -251,7 +1042,7 @@ class DB: # MySQL DB
 
     def merge_classifications_icd10_fk(self, df: pd.DataFrame, left_on: str):
 
-        df_icd10 = self.get_table('_classifications_icd10')
+        df_icd10 = self.get_dimension('_classifications_icd10')
 
         tmp = df.merge(df_icd10,
                        left_on=left_on,
@@ -278,7 +1069,7 @@ class DB: # MySQL DB
         if country_code not in country_codes:
             raise ValueError("Invalid country code standard. Expected one of: {0} ".format(country_codes))
 
-        df_countries = self.get_table('_countries')
+        df_countries = self.get_dimension('_countries')
 
         df = df.copy()
 
@@ -320,21 +1111,21 @@ class DB: # MySQL DB
             raise ValueError("Invalid country code standard. Expected one of: {0} ".format(subdiv_codes))
 
         if level == 1:
-            df_subdivisions = self.get_table('_country_subdivs_1')
+            df_subdivisions = self.get_dimension('_country_subdivs_1')
             df_subdivisions['country_subdivs_1_id'] = df_subdivisions['country_subdivs_1_id'].astype(int)
             df_subdivisions.rename(
                 columns={'country_subdivs_1_id': 'country_subdivs_1_fk'},
                 inplace=True
             )
         elif level == 2:
-            df_subdivisions = self.get_table('_country_subdivs_2')
+            df_subdivisions = self.get_dimension('_country_subdivs_2')
             df_subdivisions['country_subdivs_2_id'] = df_subdivisions['country_subdivs_2_id'].astype(int)
             df_subdivisions.rename(
                 columns={'country_subdivs_2_id': 'country_subdivs_2_fk'},
                 inplace=True
             )
         else:
-            df_subdivisions = self.get_table('_country_subdivs_3')
+            df_subdivisions = self.get_dimension('_country_subdivs_3')
             df_subdivisions['country_subdivs_3_id'] = df_subdivisions['country_subdivs_3_id'].astype(int)
             df_subdivisions.rename(
                 columns={'country_subdivs_3_id': 'country_subdivs_3_fk'},
@@ -365,7 +1156,7 @@ class DB: # MySQL DB
     def merge_vaccines_fk(self, df: pd.DataFrame, left_on: str):
 
         tmp = df.copy()
-        df_vaccines = self.get_table('_vaccines')
+        df_vaccines = self.get_dimension('_vaccines')
         df_vaccines['brand_name_1'] = df_vaccines['brand_name_1'].str.lower()
 
         tmp[left_on] = tmp[left_on].str.lower()
@@ -409,7 +1200,7 @@ class DB: # MySQL DB
     def merge_vaccine_series_fk(self, df: pd.DataFrame, left_on: str):
 
         tmp = df.copy()
-        df_vaccine_series = self.get_table('_vaccine_series')
+        df_vaccine_series = self.get_dimension('_vaccine_series')
 
         tmp = tmp.merge(df_vaccine_series,
                         left_on=left_on,
@@ -435,7 +1226,7 @@ class DB: # MySQL DB
         if level not in levels:
             raise ValueError("Invalid region level. Expected one of: {0} ".format(levels))
 
-        df_countries = self.get_table('_countries')
+        df_countries = self.get_dimension('_countries')
         countries = df_countries[country_code].tolist()
         if country.lower() not in countries:
             raise ValueError("Country not found. Expected one of: {0} ".format(countries))
@@ -555,26 +1346,113 @@ class DB: # MySQL DB
             ]
         return df
 
+    def get_population_index(self, country: str, country_code: str) -> PopulationIndex:
+        # one query for all levels and years, cached for the whole run
+        country_codes = ['iso_3166_1_alpha2', 'iso_3166_1_alpha3', 'iso_3166_1_numeric', 'nuts_0']
+
+        if country_code not in country_codes:
+            raise ValueError("Invalid country code standard. Expected one of: {0} ".format(country_codes))
+
+        with _population_indexes_lock:
+            if (country_code, country) not in _population_indexes:
+                # codes are stored lowercase by merge_countries_fk, the configured code may be uppercase (e.g. 'DE')
+                countries = self.get_dimension('_countries')[country_code].astype(str).str.lower().tolist()
+                if str(country).lower() not in countries:
+                    raise ValueError("Country not found. Expected one of: {0} ".format(countries))
+
+                query = text(
+                    '''
+                    SELECT 0 AS level, _countries.nuts_0 AS region_code, _calendar_years.iso_year,
+                        population_countries.population, _countries.countries_id AS region_fk
+                    FROM population_countries
+                    INNER JOIN _countries
+                    ON population_countries.countries_fk = _countries.countries_id
+                    INNER JOIN _calendar_years
+                    ON population_countries.calendar_years_fk = _calendar_years.calendar_years_id
+                    WHERE lower(_countries.''' + country_code + ''') = lower(:country)
+                    UNION ALL
+                    SELECT 1, CAST(_country_subdivs_1.bundesland_id AS CHAR), _calendar_years.iso_year,
+                        population_subdivs_1.population, _country_subdivs_1.country_subdivs_1_id
+                    FROM population_subdivs_1
+                    INNER JOIN _country_subdivs_1
+                    ON population_subdivs_1.country_subdivs_1_fk = _country_subdivs_1.country_subdivs_1_id
+                    INNER JOIN _countries
+                    ON _country_subdivs_1.countries_fk = _countries.countries_id
+                    INNER JOIN _calendar_years
+                    ON population_subdivs_1.calendar_years_fk = _calendar_years.calendar_years_id
+                    WHERE lower(_countries.''' + country_code + ''') = lower(:country)
+                    UNION ALL
+                    SELECT 2, _country_subdivs_2.nuts_2, _calendar_years.iso_year,
+                        population_subdivs_2.population, _country_subdivs_2.country_subdivs_2_id
+                    FROM population_subdivs_2
+                    INNER JOIN _country_subdivs_2
+                    ON population_subdivs_2.country_subdivs_2_fk = _country_subdivs_2.country_subdivs_2_id
+                    INNER JOIN _country_subdivs_1
+                    ON _country_subdivs_2.country_subdivs_1_fk = _country_subdivs_1.country_subdivs_1_id
+                    INNER JOIN _countries
+                    ON _country_subdivs_1.countries_fk = _countries.countries_id
+                    INNER JOIN _calendar_years
+                    ON population_subdivs_2.calendar_years_fk = _calendar_years.calendar_years_id
+                    WHERE lower(_countries.''' + country_code + ''') = lower(:country)
+                    UNION ALL
+                    SELECT 3, CAST(_country_subdivs_3.ags AS CHAR), _calendar_years.iso_year,
+                        population_subdivs_3.population, _country_subdivs_3.country_subdivs_3_id
+                    FROM population_subdivs_3
+                    INNER JOIN _country_subdivs_3
+                    ON population_subdivs_3.country_subdivs_3_fk = _country_subdivs_3.country_subdivs_3_id
+                    INNER JOIN _country_subdivs_2
+                    ON _country_subdivs_3.country_subdivs_2_fk = _country_subdivs_2.country_subdivs_2_id
+                    INNER JOIN _country_subdivs_1
+                    ON _country_subdivs_2.country_subdivs_1_fk = _country_subdivs_1.country_subdivs_1_id
+                    INNER JOIN _countries
+                    ON _country_subdivs_1.countries_fk = _countries.countries_id
+                    INNER JOIN _calendar_years
+                    ON population_subdivs_3.calendar_years_fk = _calendar_years.calendar_years_id
+                    WHERE lower(_countries.''' + country_code + ''') = lower(:country)
+                    ;
+                    '''
+                )
+                df = pd.read_sql(query, self.connection, params={'country': country})
+                if df.empty:
+                    raise ValueError("No population found for country {0}".format(country))
+                _population_indexes[(country_code, country)] = PopulationIndex(df)
+
+            return _population_indexes[(country_code, country)]
+
     def get_population_by_agegroups(self, year: str):
         pass
         # TODO
 
-    def insert_only_new_rows(self, df: pd.DataFrame, table: str):
-        pass
-        # TODO
-        """
-        self.insert_and_replace(df, 'tmp')
+    def insert_only_new_rows(self, df: pd.DataFrame, table: str) -> int:
+        return self._write('insert_only_new_rows', df=df, table=table)
+
+    def _insert_only_new_rows(self, df: pd.DataFrame, table: str) -> int:
+        # Append-only load for sources whose rows never change once published:
+        # rows whose unique_key already exists are left untouched.
+        # Returns the number of rows actually inserted.
+        tmp = self._prepare_upsert(df, table)
 
-        cols = ', '.join(self.get_column_names(table))
+        if tmp.empty:
+            return 0
+
+        staging = self._load_staging_table(tmp, table)
+        cols = ", ".join(self._quote_columns(tmp.columns))
 
         query = \
-            "INSERT INTO " + table + "(" + cols + ") " + \
-            "SELECT " + cols + " FROM tmp t " + \
+            "INSERT INTO " + table + " (" + cols + ") " + \
+            "SELECT " + cols + " FROM " + staging + " t " + \
             "WHERE NOT EXISTS " + \
             "(" \
             "SELECT 1 FROM " + table + " sub " + \
-            "WHERE sub.reporting_date = t.reporting_date" \
+            "WHERE sub.unique_key = t.unique_key" \
             ")" \
             ";"
-        self.connection.execute(query)
-        """
+        with self.connection.begin():
+            inserted = self.connection.execute(text(query)).rowcount
+
+        self.backend.drop_staging_table(self.connection, staging)
+
+        if parquet_sink.is_enabled(table):
+            parquet_sink.write(tmp, table, self, mode='append')
+
+        return inserted
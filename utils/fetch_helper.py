@@ -0,0 +1,97 @@
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+import pandas as pd
+
+from config.core import config
+
+
+class ConcurrentFetch:
+    """
+    Starts all source downloads at once on a bounded thread pool. get() waits only for the requested
+    source, completed() yields the sources in the order their downloads finish, so each transformation
+    can start while the remaining sources are still downloading.
+
+    Usage:
+        with ConcurrentFetch({'RKI_COVID19_DAILY': (rki, {'url': ..., ...}), ...}) as sources:
+            covid.rki_daily(df=sources.get('RKI_COVID19_DAILY'))
+
+        with ConcurrentFetch({...}) as sources:
+            for name, df in sources.completed():
+                transformations[name](df=df)
+    """
+
+    def __init__(self, sources: dict, workers: int = None, timeout: float = None):
+        """
+        :param sources: name -> (fetch function, keyword arguments)
+        :param workers: Parallel downloads, defaults to fetch_workers of the config
+        :param timeout: Seconds per source counted from the start of the fetch stage,
+            defaults to fetch_timeouts[name] or fetch_timeout of the config
+        """
+        if workers is None:
+            workers = config.data.fetch_workers
+
+        if workers < 1:
+            raise ValueError("Invalid number of workers. Expected a positive integer, got {0} ".format(workers))
+
+        self.timeout = timeout
+        self.started = time.monotonic()
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='fetch')
+        self.futures = {
+            name: self.executor.submit(function, **kwargs)
+            for name, (function, kwargs) in sources.items()
+        }
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _get_timeout(self, name: str) -> float:
+        if self.timeout is not None:
+            return self.timeout
+        # values of the fetch_timeouts map are read as strings from the config
+        return float(config.data.fetch_timeouts.get(name, config.data.fetch_timeout))
+
+    def get(self, name: str) -> pd.DataFrame:
+        # re-raises the error of the download; a hung download raises TimeoutError
+        remaining = self.started + self._get_timeout(name) - time.monotonic()
+        try:
+            return self.futures[name].result(timeout=max(remaining, 0))
+        except FutureTimeoutError:
+            raise TimeoutError("Fetching {0} took longer than {1} seconds".format(name, self._get_timeout(name)))
+
+    def completed(self):
+        """
+        Yields (name, pd.DataFrame) as soon as a download finished. A failed download or a source that exceeds
+        its timeout (TimeoutError) does not stop the other sources, its error is raised after they were yielded
+        """
+        pending = {future: name for name, future in self.futures.items()}
+        errors = []
+        while pending:
+            deadline = min(self.started + self._get_timeout(name) for name in pending.values())
+            done, _ = wait(pending, timeout=max(deadline - time.monotonic(), 0), return_when=FIRST_COMPLETED)
+            if not done:
+                # the source whose timeout passed is given up, the others keep their own deadlines
+                future, name = min(pending.items(), key=lambda item: self._get_timeout(item[1]))
+                del pending[future]
+                errors.append(TimeoutError(
+                    "Fetching {0} took longer than {1} seconds".format(name, self._get_timeout(name))
+                ))
+                continue
+            for future in done:
+                name = pending.pop(future)
+                try:
+                    df = future.result()
+                except Exception as e:
+                    errors.append(e)
+                    continue
+                yield name, df
+        if errors:
+            raise errors[0]
+
+    def close(self):
+        # downloads that were not started yet are dropped, running ones cannot be interrupted
+        self.executor.shutdown(wait=False, cancel_futures=True)
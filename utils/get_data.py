@@ -1,23 +1,295 @@
-import io
+import codecs
+import hashlib
+import json
+import os
+import tempfile
+import threading
 from datetime import datetime
-from typing import Union
+from typing import Callable
 
 import eurostat
 import pandas as pd
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from pygenesis.py_genesis_client import PyGenesisClient
 from pathlib import Path
-from config.core import config_db
+from config.core import FILES_PATH, config, config_db
 
-def http_request(url: str, decode: bool = True) -> Union[io.StringIO, bytes]:
-    response = requests.get(url)
-    if decode:
+HTTP_CACHE_PATH = FILES_PATH / 'http_cache'
+DOWNLOADS_PATH = FILES_PATH / 'downloads'
+CSV_ENGINES = ['python', 'c', 'pyarrow']
+# transient server errors that are retried with exponential backoff
+RETRY_STATUS_CODES = [500, 502, 503, 504]
+UMLAUTS = {'Ä': 'Ae', 'Ü': 'Ue', 'Ö': 'Oe', 'ä': 'ae', 'ü': 'ue', 'ö': 'oe'}
+
+
+# one session for all fetchers, connections to the same host are kept alive and reused
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session() -> requests.Session:
+    """
+    Shared requests.Session with a connection pool per host (sized for fetch_workers parallel downloads)
+    and retries of connection errors and 5xx responses with exponential backoff (http_retries, http_backoff)
+    """
+    global _session
+
+    with _session_lock:
+        if _session is None:
+            retry = Retry(
+                total=config.data.http_retries,
+                backoff_factor=config.data.http_backoff,
+                status_forcelist=RETRY_STATUS_CODES,
+                allowed_methods=['GET', 'HEAD'],
+                raise_on_status=False
+            )
+            adapter = HTTPAdapter(
+                pool_connections=config.data.fetch_workers,
+                pool_maxsize=config.data.fetch_workers,
+                max_retries=retry
+            )
+            session = requests.Session()
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            _session = session
+        return _session
+
+
+def get_timeout() -> tuple:
+    # (connect, read) in seconds, the read timeout applies between two received chunks, not to the whole download
+    return config.data.http_connect_timeout, config.data.http_read_timeout
+
+
+def _http_cache_files(url: str) -> tuple:
+    key = hashlib.sha256(url.encode('utf-8')).hexdigest()
+    return HTTP_CACHE_PATH / (key + '.json'), HTTP_CACHE_PATH / (key + '.ftr')
+
+
+def _write_http_cache(url: str, response: requests.Response, df: pd.DataFrame, fingerprint: str = None):
+    validators = {
+        'etag': response.headers.get('ETag'),
+        'last_modified': response.headers.get('Last-Modified')
+    }
+    if validators['etag'] is None and validators['last_modified'] is None:
+        return
+
+    meta_file, frame_file = _http_cache_files(url)
+    HTTP_CACHE_PATH.mkdir(parents=True, exist_ok=True)
+    try:
+        df.reset_index(drop=True).to_feather(frame_file)
+    except Exception as e:
+        # e.g. mixed-type object columns, the source is then simply downloaded again next time
+        print('Could not cache ' + url + ': ' + str(e))
+        return
+
+    # the validators are written last, a missing or older frame is never served for them
+    with open(meta_file, 'w') as f:
+        json.dump(dict(url=url, cached=datetime.now().strftime('%Y-%m-%d %H:%M:%S'), fingerprint=fingerprint, **validators), f)
+
+
+def detect_encoding(path: Path, sample_size: int = None) -> str:
+    # UTF-8 if a prefix sample decodes as UTF-8 (a character cut off at the end is fine), else ISO-8859-1
+    if sample_size is None:
+        sample_size = config.data.encoding_sample_size
+
+    with open(path, 'rb') as f:
+        sample = f.read(sample_size)
+    try:
+        codecs.getincrementaldecoder('utf-8')().decode(sample, final=False)
+        return 'utf-8'
+    except UnicodeDecodeError:
+        return 'ISO-8859-1'
+
+
+def download(response: requests.Response, path: Path, chunk_size: int = None):
+    # writes a streamed response to disk chunk by chunk, only one chunk is held in memory
+    if chunk_size is None:
+        chunk_size = config.data.download_chunk_size
+
+    with open(path, 'wb') as f:
+        for chunk in response.iter_content(chunk_size=chunk_size):
+            f.write(chunk)
+
+
+def _part_files(url: str) -> tuple:
+    key = hashlib.sha256(url.encode('utf-8')).hexdigest()
+    return DOWNLOADS_PATH / (key + '.part'), DOWNLOADS_PATH / (key + '.part.json')
+
+
+def _remove_part(url: str):
+    for path in _part_files(url):
+        if path.exists():
+            os.remove(path)
+
+
+def _resume_headers(url: str) -> dict:
+    # Range from the received size of a partial file; If-Range makes the server send the whole file if it changed
+    part_file, meta_file = _part_files(url)
+    if not part_file.exists() or not meta_file.exists():
+        return {}
+
+    with open(meta_file, 'r') as f:
+        meta = json.load(f)
+    validator = meta.get('etag') or meta.get('last_modified')
+    size = part_file.stat().st_size
+    if validator is None or size == 0:
+        return {}
+    return {'Range': 'bytes={0}-'.format(size), 'If-Range': validator}
+
+
+def _content_range(response: requests.Response) -> tuple:
+    # 'bytes 1000-4999/5000' -> (1000, 5000), total is None for '*'
+    byte_range, total = response.headers['Content-Range'].split(' ', 1)[1].split('/')
+    return int(byte_range.split('-')[0]), None if total == '*' else int(total)
+
+
+def download_resumable(url: str, response: requests.Response, retries: int = None, chunk_size: int = None) -> Path:
+    """
+    Writes a streamed response to files/downloads/<key>.part. If the connection drops, the download is
+    continued with a Range request from the received size, as long as the ETag/Last-Modified of the file
+    is unchanged (If-Range) and the total length matches. The partial file of an aborted run is continued
+    the same way, if the first request carried _resume_headers(url).
+
+    :param url: URL of the response, used for the Range requests
+    :param response: Streamed response of the first request (200, or 206 for the Range of _resume_headers)
+    :param retries: Range requests after dropped connections, defaults to download_resume_retries of the config
+    :return: Path of the complete file, to be removed by the caller
+    """
+    if retries is None:
+        retries = config.data.download_resume_retries
+    if chunk_size is None:
+        chunk_size = config.data.download_chunk_size
+
+    part_file, meta_file = _part_files(url)
+    DOWNLOADS_PATH.mkdir(parents=True, exist_ok=True)
+    responses = [response]
+
+    try:
+        for attempt in range(retries + 1):
+            meta = None
+            if response.status_code == 206 and meta_file.exists():
+                with open(meta_file, 'r') as f:
+                    meta = json.load(f)
+                start, total = _content_range(response)
+                if start != part_file.stat().st_size or total != meta['length'] \
+                        or response.headers.get('ETag', meta['etag']) != meta['etag']:
+                    # not the continuation of the partial file, start over
+                    meta = None
+
+            if meta is None:
+                if response.status_code != 200:
+                    _remove_part(url)
+                    response = get_session().get(url, stream=True, timeout=get_timeout())
+                    responses.append(response)
+                    response.raise_for_status()
+
+                length = response.headers.get('Content-Length')
+                meta = {
+                    'url': url,
+                    'etag': response.headers.get('ETag'),
+                    'last_modified': response.headers.get('Last-Modified'),
+                    # a compressed transfer has the length of the encoded body, it is not checked then
+                    'length': int(length) if length and 'Content-Encoding' not in response.headers else None
+                }
+                open(part_file, 'wb').close()
+                with open(meta_file, 'w') as f:
+                    json.dump(meta, f)
+
+            try:
+                with open(part_file, 'ab') as f:
+                    for chunk in response.iter_content(chunk_size=chunk_size):
+                        f.write(chunk)
+            except (requests.ConnectionError, requests.exceptions.ChunkedEncodingError) as e:
+                error = str(e)
+            else:
+                if meta['length'] is None or part_file.stat().st_size == meta['length']:
+                    os.remove(meta_file)
+                    return part_file
+                error = 'connection closed early'
+
+            print(url + ': download interrupted at ' + str(part_file.stat().st_size) + ' bytes (' + error + ')')
+            if attempt == retries:
+                break
+
+            response = get_session().get(url, headers=_resume_headers(url), stream=True, timeout=get_timeout())
+            responses.append(response)
+            if response.status_code == 416:
+                # the range does not fit the file (anymore)
+                _remove_part(url)
+                response = get_session().get(url, stream=True, timeout=get_timeout())
+                responses.append(response)
+            response.raise_for_status()
+    finally:
+        for r in responses[1:]:
+            r.close()
+
+    raise IOError('Download of {0} incomplete after {1} resumptions'.format(url, retries))
+
+
+def http_frame(url: str, parse: Callable[[Path, str], pd.DataFrame], resumable: bool = False,
+               fingerprint: str = None) -> pd.DataFrame:
+    """
+    Downloads a URL to a temporary file and parses it into a Pandas Dataframe, with a local HTTP cache keyed by URL:
+    the ETag/Last-Modified of the last download are sent as If-None-Match/If-Modified-Since,
+    and on 304 Not Modified the cached parsed frame is returned without downloading or parsing
+
+    :param url: URL
+    :param parse: Turns the downloaded file (path, encoding) into the Dataframe to cache.
+        If it fails with a UnicodeDecodeError for UTF-8, it is called again with ISO-8859-1
+    :param resumable: Download to files/downloads with Range resumption after dropped connections
+        (see download_resumable), for large files
+    :param fingerprint: Identifies how parse builds the frame (e.g. _csv_fingerprint), the cached frame
+        is only served for the same fingerprint
+    :return: pd.Dataframe
+    """
+    meta_file, frame_file = _http_cache_files(url)
+    headers = _resume_headers(url) if resumable else {}
+
+    if config.data.http_cache and meta_file.exists() and frame_file.exists():
+        with open(meta_file, 'r') as f:
+            meta = json.load(f)
+        if meta.get('fingerprint') != fingerprint:
+            # parsed with another cols section or engine, the validators do not apply
+            meta = {}
+        if meta.get('etag'):
+            headers['If-None-Match'] = meta['etag']
+        if meta.get('last_modified'):
+            headers['If-Modified-Since'] = meta['last_modified']
+
+    with get_session().get(url, headers=headers, stream=True, timeout=get_timeout()) as response:
+        if response.status_code == 304 and headers:
+            return pd.read_feather(frame_file)
+
+        # 416: the partial file of an earlier run does not fit, download_resumable starts over
+        if not (resumable and response.status_code == 416):
+            response.raise_for_status()
+
+        if resumable:
+            tmp_file = download_resumable(url, response)
+        else:
+            fd, tmp_file = tempfile.mkstemp(suffix='.download')
+            os.close(fd)
+            tmp_file = Path(tmp_file)
         try:
-            return io.StringIO(response.content.decode('utf-8'))
-        except UnicodeDecodeError:
-            return io.StringIO(response.content.decode('ISO-8859-1'))
-    else:
-        return response.content
+            if not resumable:
+                download(response, tmp_file)
+            encoding = detect_encoding(tmp_file)
+            try:
+                df = parse(tmp_file, encoding)
+            except UnicodeDecodeError:
+                if encoding != 'utf-8':
+                    raise
+                # invalid UTF-8 after the sample
+                df = parse(tmp_file, 'ISO-8859-1')
+        finally:
+            os.remove(tmp_file)
+
+    if config.data.http_cache:
+        _write_http_cache(url, response, df, fingerprint=fingerprint)
+
+    return df
 
 
 def _handle_german_umlauts_in_columns(df: pd.DataFrame) -> pd.DataFrame:
@@ -31,7 +303,70 @@ def _handle_german_umlauts_in_columns(df: pd.DataFrame) -> pd.DataFrame:
     return tmp
 
 
-def rki(url: str, purpose: str, save_file: bool, data_type: str, path: Path = None, is_excel: bool = False, sheet_name: str = '') -> pd.DataFrame:
+def _replace_umlauts(col: str) -> str:
+    # same replacements as _handle_german_umlauts_in_columns, for a single column name
+    for umlaut, replacement in UMLAUTS.items():
+        col = col.replace(umlaut, replacement)
+    return col
+
+
+def _get_csv_schema(file: Path, encoding: str, schema: str) -> tuple:
+    """
+    Resolves the translation and dtypes of a config cols section against the header of a CSV file
+
+    :return: (usecols, dtype) keyed by the raw column names of the file
+    """
+    section = getattr(config.cols, schema)
+    translation = section['translation']
+    dtypes = section.get('dtypes', {})
+
+    # translation and dtypes are keyed by the column names after umlaut handling
+    header = pd.read_csv(file, sep=',', encoding=encoding, nrows=0).columns
+    usecols = [col for col in header if _replace_umlauts(col) in translation]
+    dtype = {col: dtypes[_replace_umlauts(col)] for col in usecols if _replace_umlauts(col) in dtypes}
+    return usecols, dtype
+
+
+def _csv_fingerprint(schema: str = None) -> str:
+    # everything besides the file that _parse_csv's frame depends on: translation and dtypes of the section, engine
+    if schema is None:
+        return 'python'
+    section = getattr(config.cols, schema)
+    spec = dict(engine=config.data.csv_engine, translation=section['translation'], dtypes=section.get('dtypes', {}))
+    return hashlib.sha256(json.dumps(spec, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def _parse_csv(file: Path, encoding: str, schema: str = None) -> pd.DataFrame:
+    """
+    :param schema: Config cols section (e.g. 'rki_covid_daily'). If given, only the columns of its translation
+        are read, with the types of its optional dtypes map, and the engine is csv_engine of the config.
+        Otherwise the whole file is read with the python engine and inferred types.
+    """
+    if schema is None:
+        df = pd.read_csv(
+            file,
+            engine='python',
+            sep=',',
+            encoding=encoding
+        )
+    else:
+        engine = config.data.csv_engine
+        if engine not in CSV_ENGINES:
+            raise ValueError("Invalid CSV engine. Expected one of: {0} ".format(CSV_ENGINES))
+
+        usecols, dtype = _get_csv_schema(file, encoding, schema)
+        df = pd.read_csv(
+            file,
+            engine=engine,
+            sep=',',
+            encoding=encoding,
+            usecols=usecols,
+            dtype=dtype
+        )
+    return _handle_german_umlauts_in_columns(df=df)
+
+
+def rki(url: str, purpose: str, save_file: bool, data_type: str, path: Path = None, is_excel: bool = False, sheet_name: str = '', schema: str = None, resumable: bool = False) -> pd.DataFrame:
     """
     Reads a given URL from RKI and returns it as a Pandas Dataframe
 
@@ -41,6 +376,8 @@ def rki(url: str, purpose: str, save_file: bool, data_type: str, path: Path = No
     :param path: Path in which the file should be saved
     :param is_excel: Determines if given URL is an Excel-file
     :param sheet_name: which Excel-Sheet should be processed
+    :param schema: Config cols section whose translation and dtypes are used to read a CSV file
+    :param resumable: Resume the download with Range requests after dropped connections
     :return: pd.Dataframe
     """
 
@@ -54,19 +391,15 @@ def rki(url: str, purpose: str, save_file: bool, data_type: str, path: Path = No
         raise RuntimeError('Sheet given but no Excel file')
 
     if is_excel:
-        df = pd.read_excel(
-            http_request(url, decode=False),
-            sheet_name=sheet_name
-        )
-        df = _handle_german_umlauts_in_columns(df=df)
-        df = df[df.filter(regex='^(?!Unnamed)').columns]
+        def parse(file: Path, encoding: str) -> pd.DataFrame:
+            tmp = pd.read_excel(file, sheet_name=sheet_name)
+            tmp = _handle_german_umlauts_in_columns(df=tmp)
+            return tmp[tmp.filter(regex='^(?!Unnamed)').columns]
+
+        df = http_frame(url, parse=parse, resumable=resumable, fingerprint='excel:' + sheet_name)
     else:
-        df = pd.read_csv(
-            http_request(url),
-            engine='python',
-            sep=','
-        )
-        df = _handle_german_umlauts_in_columns(df=df)
+        df = http_frame(url, parse=lambda file, encoding: _parse_csv(file, encoding, schema=schema),
+                        resumable=resumable, fingerprint=_csv_fingerprint(schema))
 
     if save_file:
         filename = datetime.now().strftime(purpose.upper() + '_%Y-%m-%d.' + data_type)
@@ -127,7 +460,7 @@ def estat(code: str, purpose: str, save_file: bool, data_type: str, path: Path =
     return df
 
 
-def divi(url: str, purpose: str, save_file: bool, data_type: str, path: Path = None) -> pd.DataFrame:
+def divi(url: str, purpose: str, save_file: bool, data_type: str, path: Path = None, schema: str = None) -> pd.DataFrame:
     """
     Reads a given URL from DIVI and returns it as a Pandas Dataframe
 
@@ -135,6 +468,7 @@ def divi(url: str, purpose: str, save_file: bool, data_type: str, path: Path = N
     :param purpose: Should indicate which type of data should be loaded (e.g. Tests, R-Value, etc.)
     :param save_file: Determines if the file should be saved as .csv
     :param path: Path in which the file should be saved
+    :param schema: Config cols section whose translation and dtypes are used to read the file
     :return: pd.Dataframe
     """
 
@@ -143,12 +477,8 @@ def divi(url: str, purpose: str, save_file: bool, data_type: str, path: Path = N
     if not save_file and path is not None:
         raise RuntimeError('Path was given but save_file is false')
 
-    df = pd.read_csv(
-        http_request(url),
-        engine='python',
-        sep=','
-    )
-    df = _handle_german_umlauts_in_columns(df=df)
+    df = http_frame(url, parse=lambda file, encoding: _parse_csv(file, encoding, schema=schema),
+                    fingerprint=_csv_fingerprint(schema))
 
     if save_file:
         filename = datetime.now().strftime(purpose.upper() + '_%Y-%m-%d.' + data_type)
@@ -214,7 +544,7 @@ def genesis(code: str, purpose: str, save_file: bool, data_type: str, path: Path
     return df
 
 
-def owid(url: str, purpose: str, save_file: bool, data_type: str, path: Path = None) -> pd.DataFrame:
+def owid(url: str, purpose: str, save_file: bool, data_type: str, path: Path = None, schema: str = None) -> pd.DataFrame:
     """
     Reads a given URL from Our World in Data and returns it as a Pandas Dataframe
 
@@ -222,6 +552,7 @@ def owid(url: str, purpose: str, save_file: bool, data_type: str, path: Path = N
     :param purpose: Indicate which purpose the data fullfills (e.g. Tests, R-Value, etc.)
     :param save_file: Determines if the file should be saved as .csv
     :param path: Path in which the file should be saved
+    :param schema: Config cols section whose translation and dtypes are used to read the file
     :return: pd.Dataframe
     """
 
@@ -230,11 +561,8 @@ def owid(url: str, purpose: str, save_file: bool, data_type: str, path: Path = N
     if not save_file and path is not None:
         raise RuntimeError('Path was given but save_file is false')
 
-    df = pd.read_csv(
-        http_request(url),
-        engine='python',
-        sep=','
-    )
+    df = http_frame(url, parse=lambda file, encoding: _parse_csv(file, encoding, schema=schema),
+                    fingerprint=_csv_fingerprint(schema))
 
     if save_file:
         filename = datetime.now().strftime(purpose.upper() + '_%Y-%m-%d.' + data_type)
@@ -0,0 +1,132 @@
+import itertools
+import json
+import os
+import threading
+import time
+
+import pandas as pd
+
+from config.core import FILES_PATH, config_db
+
+OUTBOX_PATH = FILES_PATH / 'outbox'
+OUTBOX_MODES = ['off', 'fallback', 'always']
+# DB methods that can be spooled
+OUTBOX_METHODS = ['insert_into', 'insert_or_update', 'insert_only_new_rows']
+
+_sequence = itertools.count()
+_sequence_lock = threading.Lock()
+
+
+def get_mode() -> str:
+    # 'off': write directly, 'fallback': spool writes that fail with a database error, 'always': only spool
+    mode = config_db.outbox_mode
+
+    if mode not in OUTBOX_MODES:
+        raise ValueError("Invalid outbox mode. Expected one of: {0} ".format(OUTBOX_MODES))
+
+    return mode
+
+
+def spool(method: str, df: pd.DataFrame, table: str, **kwargs) -> str:
+    """
+    Stores a frame handed to a DB write method as feather plus a JSON manifest in files/outbox.
+    The manifest is written last, so only complete batches are replayed.
+
+    :return: Batch name
+    """
+    if method not in OUTBOX_METHODS:
+        raise ValueError("Invalid outbox method. Expected one of: {0} ".format(OUTBOX_METHODS))
+
+    with _sequence_lock:
+        batch = time.strftime('%Y%m%d%H%M%S') + '_' + str(os.getpid()) + '_' + str(next(_sequence)).zfill(6)
+
+    OUTBOX_PATH.mkdir(parents=True, exist_ok=True)
+    df.reset_index(drop=True).to_feather(OUTBOX_PATH / (batch + '.ftr'))
+
+    manifest = {
+        'batch': batch,
+        'table': table,
+        'method': method,
+        'kwargs': kwargs,
+        'rows': len(df),
+        'created': time.strftime('%Y-%m-%d %H:%M:%S')
+    }
+    tmp_file = OUTBOX_PATH / (batch + '.json.tmp')
+    with open(tmp_file, 'w') as f:
+        json.dump(manifest, f)
+    os.replace(tmp_file, OUTBOX_PATH / (batch + '.json'))
+
+    print(table + ': ' + str(len(df)) + ' rows spooled to outbox (' + batch + ')')
+    return batch
+
+
+def pending() -> list:
+    # manifests of all complete batches, oldest first
+    if not OUTBOX_PATH.exists():
+        return []
+
+    manifests = []
+    for manifest_file in sorted(OUTBOX_PATH.glob('*.json')):
+        with open(manifest_file, 'r') as f:
+            manifests.append(json.load(f))
+    return manifests
+
+
+def _remove(batch: str):
+    for suffix in ('.json', '.ftr'):
+        path = OUTBOX_PATH / (batch + suffix)
+        if path.exists():
+            os.remove(path)
+
+
+def _group_batches(manifests: list) -> list:
+    # consecutive batches for the same table, method and arguments are written together
+    groups = []
+    for manifest in manifests:
+        key = (manifest['table'], manifest['method'], json.dumps(manifest['kwargs'], sort_keys=True))
+        if groups and groups[-1][0] == key:
+            groups[-1][1].append(manifest)
+        else:
+            groups.append((key, [manifest]))
+    return groups
+
+
+def replay(db) -> dict:
+    """
+    Writes all pending batches through db, grouped per table, and removes them from the outbox.
+    Upserts without an explicit strategy are bulk-loaded. Stops at the first failing group,
+    which stays in the outbox together with all later batches.
+
+    :param db: DB instance, its own outbox handling is switched off
+    :return: dict of table -> written rows
+    """
+    db.use_outbox = False
+    written = {}
+
+    for (table, method, _), manifests in _group_batches(pending()):
+        kwargs = dict(manifests[0]['kwargs'])
+
+        if method == 'insert_into':
+            # every insert_into replaces the table's content, only the latest batch counts
+            df = pd.read_feather(OUTBOX_PATH / (manifests[-1]['batch'] + '.ftr'))
+        else:
+            df = pd.concat(
+                [pd.read_feather(OUTBOX_PATH / (manifest['batch'] + '.ftr')) for manifest in manifests],
+                ignore_index=True
+            )
+            # later batches win for rows with the same foreign keys (unique_key)
+            foreign_keys = [col for col in df if col.lower().endswith('_fk')]
+            if foreign_keys:
+                df = df.drop_duplicates(subset=foreign_keys, keep='last')
+
+        if method == 'insert_or_update' and kwargs.get('strategy') is None:
+            kwargs['strategy'] = 'bulk'
+
+        getattr(db, method)(df=df, table=table, **kwargs)
+
+        for manifest in manifests:
+            _remove(manifest['batch'])
+        written[table] = written.get(table, 0) + len(df)
+        print(table + ': ' + str(len(df)) + ' rows replayed from ' + str(len(manifests)) + ' batch(es)')
+
+    return written
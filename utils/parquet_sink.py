@@ -0,0 +1,167 @@
+import os
+import shutil
+import threading
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from config.core import FILES_PATH, config_db
+
+PARQUET_PATH = FILES_PATH / 'parquet'
+PARTITIONINGS = ['auto', 'week', 'date', 'year', 'none']
+PARTITION_COLS = {
+    'week': ['iso_year', 'iso_week'],
+    'date': ['iso_day'],
+    'year': ['iso_year'],
+    'none': []
+}
+PART_FILE = 'part-0.parquet'
+
+# one lock per table, a partition must not be merged by two writers at once
+_table_locks = {}
+_table_locks_lock = threading.Lock()
+
+
+def _get_table_lock(table: str) -> threading.Lock:
+    with _table_locks_lock:
+        return _table_locks.setdefault(table, threading.Lock())
+
+
+def is_enabled(table: str) -> bool:
+    return config_db.parquet_sink and not table.startswith('_')
+
+
+def get_partitioning(df: pd.DataFrame, table: str) -> str:
+    # explicit per-table config > derived from the calendar foreign key of the frame
+    partitioning = config_db.parquet_partitions.get(table, 'auto')
+
+    if partitioning not in PARTITIONINGS:
+        raise ValueError("Invalid partitioning. Expected one of: {0} ".format(PARTITIONINGS))
+
+    if partitioning == 'auto':
+        if 'calendar_days_fk' in df.columns or 'calendar_weeks_fk' in df.columns:
+            partitioning = 'week'
+        elif 'calendar_years_fk' in df.columns:
+            partitioning = 'year'
+        else:
+            partitioning = 'none'
+
+    if partitioning == 'date' and 'calendar_days_fk' not in df.columns:
+        raise ValueError("Partitioning by date needs calendar_days_fk in {0}".format(table))
+
+    return partitioning
+
+
+def add_partition_columns(df: pd.DataFrame, partitioning: str, db) -> pd.DataFrame:
+    """
+    Resolves the calendar foreign keys of df into iso_year/iso_week or iso_day,
+    using the cached calendar dimensions of db
+    """
+    tmp = df.copy()
+
+    if partitioning == 'none':
+        return tmp
+
+    if 'calendar_days_fk' in tmp.columns:
+        days = db.get_dimension('_calendar_days').set_index('calendar_days_id')['iso_day']
+        iso_day = tmp['calendar_days_fk'].map(days)
+        if partitioning == 'date':
+            tmp['iso_day'] = iso_day.dt.strftime('%Y-%m-%d')
+            return tmp
+        iso_calendar = iso_day.dt.isocalendar()
+        tmp['iso_year'] = iso_calendar['year']
+        if partitioning == 'week':
+            tmp['iso_week'] = iso_calendar['week']
+    elif 'calendar_weeks_fk' in tmp.columns:
+        iso_key = tmp['calendar_weeks_fk'].map(
+            db.get_dimension('_calendar_weeks').set_index('calendar_weeks_id')['iso_key']
+        )
+        tmp['iso_year'] = iso_key // 100
+        if partitioning == 'week':
+            tmp['iso_week'] = iso_key % 100
+    else:
+        tmp['iso_year'] = tmp['calendar_years_fk'].map(
+            db.get_dimension('_calendar_years').set_index('calendar_years_id')['iso_year']
+        )
+
+    partition_cols = PARTITION_COLS[partitioning]
+    tmp[partition_cols] = tmp[partition_cols].fillna(0).astype(int)
+    return tmp
+
+
+def _partition_dir(table: str, partition_cols: list, values):
+    if not isinstance(values, tuple):
+        values = (values,)
+
+    path = PARQUET_PATH / table
+    for col, value in zip(partition_cols, values):
+        path = path / (col + '=' + str(value))
+    return path
+
+
+def _write_partition(path, df: pd.DataFrame):
+    # write next to the old file and swap, so readers never see a half-written partition
+    path.mkdir(parents=True, exist_ok=True)
+    tmp_file = path / (PART_FILE + '.tmp')
+    pq.write_table(
+        pa.Table.from_pandas(df, preserve_index=False),
+        tmp_file,
+        use_dictionary=True,
+        compression='snappy'
+    )
+    os.replace(tmp_file, path / PART_FILE)
+
+
+def write(df: pd.DataFrame, table: str, db, mode: str = 'upsert') -> int:
+    """
+    Writes a prepared frame (with unique_key) into the Hive-partitioned dataset files/parquet/<table>.
+    Only partitions that contain rows of df are rewritten.
+
+    :param df: Prepared frame as written to the database
+    :param table: Table name
+    :param db: DB instance, used for the calendar dimensions
+    :param mode: 'upsert': rows replace stored rows with the same unique_key,
+        'append': stored rows win (insert_only_new_rows),
+        'replace': the whole dataset is replaced by df
+    :return: Number of rewritten partitions
+    """
+    if df.empty and mode != 'replace':
+        return 0
+
+    partitioning = get_partitioning(df, table)
+    partition_cols = PARTITION_COLS[partitioning]
+    tmp = add_partition_columns(df, partitioning, db)
+
+    with _get_table_lock(table):
+        if mode == 'replace':
+            shutil.rmtree(PARQUET_PATH / table, ignore_errors=True)
+
+        if not partition_cols:
+            groups = [((), tmp)]
+        else:
+            # a single key yields scalar group values, as _partition_dir expects
+            groups = tmp.groupby(partition_cols[0] if len(partition_cols) == 1 else partition_cols, sort=False)
+
+        partitions = 0
+        for values, new in groups:
+            path = _partition_dir(table, partition_cols, values)
+            new = new.drop(columns=partition_cols)
+
+            if mode != 'replace' and (path / PART_FILE).exists():
+                stored = pd.read_parquet(path / PART_FILE)
+                merged = pd.concat([stored, new], ignore_index=True).drop_duplicates(
+                    subset='unique_key', keep='first' if mode == 'append' else 'last'
+                )
+            else:
+                merged = new
+
+            _write_partition(path, merged)
+            partitions += 1
+
+    return partitions
+
+
+def read(table: str, columns: list = None, filters: list = None) -> pd.DataFrame:
+    # e.g. read('covid_daily_counties', filters=[('iso_year', '=', 2021)])
+    return pd.read_parquet(PARQUET_PATH / table, columns=columns, filters=filters)
@@ -0,0 +1,138 @@
+import pandas as pd
+from sqlalchemy.sql import extract, func, select
+
+import utils.db_helper as database
+
+PERIODS = ['year', 'month']
+PERIOD_COLS = {
+    'year': ['iso_year'],
+    'month': ['iso_year', 'month']
+}
+
+
+def _period_columns(calendar_days, period: str) -> list:
+    cols = [extract('year', calendar_days.c.iso_day).label('iso_year')]
+    if period == 'month':
+        cols.append(extract('month', calendar_days.c.iso_day).label('month'))
+    return cols
+
+
+def get_snapshot_days(db: database.DB, source_table: str, period: str) -> pd.DataFrame:
+    """
+    Last day with data of every period in the daily fact table, aggregated in SQL
+
+    :return: pd.DataFrame with the period columns and iso_day, sorted by period
+    """
+    source = db.get_table_obj(source_table)
+    calendar_days = db.get_table_obj('_calendar_days')
+    period_cols = _period_columns(calendar_days, period)
+
+    query = select(*period_cols, func.max(calendar_days.c.iso_day).label('iso_day')) \
+        .select_from(source.join(calendar_days, source.c.calendar_days_fk == calendar_days.c.calendar_days_id)) \
+        .group_by(*period_cols) \
+        .order_by(*period_cols)
+
+    df = pd.DataFrame(db.connection.execute(query).fetchall(), columns=PERIOD_COLS[period] + ['iso_day'])
+    df['iso_day'] = pd.to_datetime(df['iso_day'])
+    return df
+
+
+def get_touched_periods(db: database.DB, source_table: str, period: str, since) -> set:
+    # periods with daily rows written at or after the watermark
+    source = db.get_table_obj(source_table)
+    calendar_days = db.get_table_obj('_calendar_days')
+
+    query = select(*_period_columns(calendar_days, period)).distinct() \
+        .select_from(source.join(calendar_days, source.c.calendar_days_fk == calendar_days.c.calendar_days_id)) \
+        .where(source.c.last_update >= since)
+
+    return {tuple(int(value) for value in row) for row in db.connection.execute(query).fetchall()}
+
+
+def rollup(db: database.DB, source_table: str, target_table: str, group_cols: list, period: str = 'year',
+           full: bool = False) -> dict:
+    """
+    Maintains period aggregates (annual or monthly) of a daily fact table with cumulative values.
+    The value of a period is its last daily snapshot minus the last snapshot of the previous period.
+    Only periods touched by daily rows written since the last rollup (max last_update of the target)
+    and the periods following them are recomputed.
+
+    :param db: DB instance
+    :param source_table: Daily fact table with calendar_days_fk, e.g. covid_daily
+    :param target_table: Aggregate table with calendar_years_fk (and calendar_months_fk for months, a yyyymm key
+        without a dimension table, 20 bits in key_mode 'bigint')
+    :param group_cols: Foreign keys that are kept, e.g. ['countries_fk']
+    :param period: 'year' or 'month'
+    :param full: Recompute all periods
+    :return: dict with the recomputed periods and the write stats
+    """
+    if period not in PERIODS:
+        raise ValueError("Invalid period. Expected one of: {0} ".format(PERIODS))
+
+    # the daily rows may still be queued in the background writer
+    database.flush_writer()
+
+    # upserts on unique_key and starts from max(last_update), see src/sql/covid.sql for existing tables
+    missing = [col for col in ['last_update', 'unique_key'] if col not in db.get_schema(target_table)['columns']]
+    if missing:
+        raise ValueError("{0} has no {1} column. Expected the DDL of src/sql".format(target_table, ' and '.join(missing)))
+
+    target = db.get_table_obj(target_table)
+    watermark = None if full else db.connection.execute(select(func.max(target.c.last_update))).scalar()
+
+    snapshots = get_snapshot_days(db, source_table, period)
+    period_cols = PERIOD_COLS[period]
+    periods = [tuple(int(value) for value in row) for row in snapshots[period_cols].itertuples(index=False)]
+
+    if watermark is None:
+        affected = set(range(len(periods)))
+    else:
+        touched = get_touched_periods(db, source_table, period, watermark)
+        # a changed snapshot also changes the delta of the following period
+        affected = {i for i, p in enumerate(periods) if p in touched}
+        affected |= {i + 1 for i in affected if i + 1 < len(periods)}
+
+    if not affected:
+        return {'periods': [], 'stats': None}
+
+    # affected periods and their predecessors
+    needed = sorted(affected | {i - 1 for i in affected if i > 0})
+    snapshots['period_idx'] = range(len(snapshots))
+    snapshots = snapshots[snapshots['period_idx'].isin(needed)]
+
+    calendar_days = db.get_dimension('_calendar_days')[['calendar_days_id', 'iso_day']]
+    snapshots = snapshots.merge(calendar_days, on='iso_day', how='left')
+
+    value_cols = [
+        col for col in list(db.get_schema(target_table)['columns'])[1:]
+        if col in db.get_schema(source_table)['columns']
+        and not col.endswith('_fk') and col not in database.META_COLUMNS
+    ]
+    df = pd.concat(
+        db.read_table(
+            source_table,
+            columns=group_cols + ['calendar_days_fk'] + value_cols,
+            where="calendar_days_fk IN :days",
+            params={'days': snapshots['calendar_days_id'].astype(int).tolist()}
+        ),
+        ignore_index=True
+    )
+    df = df.merge(
+        snapshots, left_on='calendar_days_fk', right_on='calendar_days_id', how='inner'
+    ).drop(columns=['calendar_days_fk', 'calendar_days_id', 'iso_day'])
+
+    # delta to the snapshot of the previous period, the first period is taken as it is
+    previous = df[group_cols + ['period_idx'] + value_cols].assign(period_idx=df['period_idx'] + 1)
+    tmp = df[df['period_idx'].isin(affected)].merge(
+        previous, on=group_cols + ['period_idx'], how='left', suffixes=('', '_previous')
+    )
+    for col in value_cols:
+        tmp[col] = tmp[col] - tmp[col + '_previous'].fillna(0)
+
+    tmp = tmp[group_cols + period_cols + value_cols]
+    if period == 'month':
+        tmp['calendar_months_fk'] = tmp['iso_year'] * 100 + tmp['month']
+    tmp = db.merge_calendar_years_fk(df=tmp, left_on='iso_year')
+
+    stats = db.insert_or_update(df=tmp, table=target_table)
+    return {'periods': [periods[i] for i in sorted(affected)], 'stats': stats}
@@ -0,0 +1,126 @@
+import re
+import threading
+import time
+
+from sqlalchemy import event
+
+from config.core import FILES_PATH, config_db
+
+SLOW_LOG_PATH = FILES_PATH / 'logs'
+SLOW_LOG_FILE = 'slow_statements.log'
+# first table named after these keywords outside of parentheses is the statement's target
+# (skips e.g. EXTRACT(year FROM ...) in the select list and subqueries)
+TABLE_PATTERN = re.compile(
+    r'\b(?:INTO\s+TABLE|INSERT\s+INTO|UPDATE|DELETE\s+FROM|FROM|TRUNCATE\s+TABLE|ALTER\s+TABLE|'
+    r'(?:CREATE|DROP)\s+(?:TEMPORARY\s+|TEMP\s+)?TABLE(?:\s+IF\s+(?:NOT\s+)?EXISTS)?)\s+[`"]?([\w.]+)',
+    re.IGNORECASE
+)
+
+# (table, statement type) -> aggregates of the current run
+_stats = {}
+_stats_lock = threading.Lock()
+
+
+def parse_statement(statement: str) -> tuple:
+    # returns (statement type, target table)
+    words = statement.lstrip().split(None, 1)
+    statement_type = words[0].upper() if words else ''
+    matches = list(TABLE_PATTERN.finditer(statement))
+    for match in matches:
+        if _paren_depth(statement, match.start()) == 0:
+            return statement_type, match.group(1)
+    return statement_type, matches[0].group(1) if matches else None
+
+
+def _paren_depth(statement: str, pos: int) -> int:
+    # parentheses in string literals are counted as well, good enough for the generated statements
+    head = statement[:pos]
+    return head.count('(') - head.count(')')
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('statement_start', []).append(time.perf_counter())
+    if context is not None:
+        context._sql_stats_started = True
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    seconds = time.perf_counter() - conn.info['statement_start'].pop()
+    if context is not None:
+        context._sql_stats_started = False
+    statement_type, table = parse_statement(statement)
+    # -1 if the driver does not know (e.g. streamed SELECTs)
+    rows = max(cursor.rowcount, 0)
+
+    with _stats_lock:
+        stats = _stats.setdefault((table, statement_type), {'statements': 0, 'rows': 0, 'seconds': 0.0, 'max_seconds': 0.0})
+        stats['statements'] += 1
+        stats['rows'] += rows
+        stats['seconds'] += seconds
+        stats['max_seconds'] = max(stats['max_seconds'], seconds)
+
+    if seconds >= config_db.slow_statement_seconds:
+        _log_slow_statement(statement, table, rows, seconds)
+
+
+def _handle_error(exception_context):
+    # the after hook is not called for failed statements, their start time has to be dropped here
+    # (only if the statement got that far, errors can also be raised before the cursor is executed or while fetching)
+    context = exception_context.execution_context
+    conn = exception_context.connection
+    if conn is not None and context is not None and getattr(context, '_sql_stats_started', False):
+        context._sql_stats_started = False
+        conn.info['statement_start'].pop()
+
+
+def _log_slow_statement(statement: str, table: str, rows: int, seconds: float):
+    SLOW_LOG_PATH.mkdir(parents=True, exist_ok=True)
+    # multi-row VALUES can be huge, the beginning is enough to identify the statement
+    statement = ' '.join(statement.split())[:500]
+    with _stats_lock:
+        with open(SLOW_LOG_PATH / SLOW_LOG_FILE, 'a', encoding='utf8') as f:
+            f.write('\t'.join([time.strftime('%Y-%m-%d %H:%M:%S'), str(table), str(rows), '%.3f' % seconds, statement]) + '\n')
+
+
+def attach(engine):
+    # registers the timing hooks once per engine
+    with _stats_lock:
+        if not event.contains(engine, 'before_cursor_execute', _before_cursor_execute):
+            event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+            event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+            event.listen(engine, 'handle_error', _handle_error)
+
+
+def summary() -> list:
+    """
+    SQL statistics of the current run, one entry per table and statement type, slowest first
+
+    :return: list of dicts with table, statement, statements, rows, seconds and max_seconds
+    """
+    with _stats_lock:
+        entries = [
+            dict(table=table, statement=statement_type, **stats)
+            for (table, statement_type), stats in _stats.items()
+        ]
+    return sorted(entries, key=lambda entry: entry['seconds'], reverse=True)
+
+
+def reset():
+    with _stats_lock:
+        _stats.clear()
+
+
+def print_summary():
+    entries = summary()
+    if not entries:
+        return
+
+    print("SQL summary (table, statement, count, rows, seconds, max seconds):")
+    for entry in entries:
+        print("  {0:<40} {1:<10} {2:>7} {3:>10} {4:>9.3f} {5:>9.3f}".format(
+            str(entry['table']), entry['statement'], entry['statements'], entry['rows'],
+            entry['seconds'], entry['max_seconds']
+        ))
+    print("  total: {0:.3f} seconds in {1} statements".format(
+        sum(entry['seconds'] for entry in entries), sum(entry['statements'] for entry in entries)
+    ))